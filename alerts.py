@@ -0,0 +1,194 @@
+# Non-blocking alert delivery for Status Snitch.
+# Alerts are written to a durable on-disk outbox and delivered by a background
+# worker: retries back off exponentially, each target is rate limited, a newer
+# alert for a target replaces its undelivered one, and everything due at once
+# goes out as a single digest message.
+
+import json
+import os
+import random
+import threading
+import time
+
+# === CONFIGURATION ===
+ALERT_OUTBOX_FILE = os.getenv('ALERT_OUTBOX_FILE', 'alerts_outbox.json')
+ALERT_MIN_INTERVAL_SECONDS = int(os.getenv('ALERT_MIN_INTERVAL_SECONDS', 300)) # Per-target rate limit
+ALERT_COALESCE_SECONDS = 5 # Let alerts that arrive together gather before sending a digest
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 15 * 60
+MAX_ALERT_AGE_SECONDS = 24 * 3600 # Undeliverable alerts are dropped after this long
+MAX_OUTBOX_ALERTS = 1000
+DIGEST_MAX_NAMES = 20 # Target names listed per status line in a digest
+
+_outbox = {'pending': [], 'last_sent': {}, 'last_message': {}}
+_outbox_file = ALERT_OUTBOX_FILE
+_send = None # callable(text) -> bool
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_stop = threading.Event()
+_worker = None
+
+# === OUTBOX ===
+
+def load_outbox(filename):
+    """Loads the outbox so alerts queued before a restart are still delivered."""
+    outbox = {'pending': [], 'last_sent': {}, 'last_message': {}}
+    if not os.path.exists(filename): return outbox
+    try:
+        with open(filename, 'r') as f:
+            stored = json.load(f)
+        for key in outbox:
+            if isinstance(stored.get(key), type(outbox[key])): outbox[key] = stored[key]
+        if outbox['pending']: print(f"Loaded {len(outbox['pending'])} undelivered alert(s) from {filename}")
+    except (IOError, json.JSONDecodeError, AttributeError) as e:
+        print(f"Alert outbox '{filename}' invalid, starting empty. Error: {e}")
+    return outbox
+
+def save_outbox(filename, outbox):
+    try:
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(outbox, f, indent=2)
+        os.replace(filename + '.tmp', filename)
+    except IOError as e:
+        print(f"Error saving alert outbox '{filename}': {e}")
+
+def add_alert(outbox, target, kind, message, status=None, now=None):
+    """Queues an alert, replacing any undelivered alert of the same kind for the target.
+
+    Returns False when the alert repeats the last message delivered for the target.
+    """
+    now = now if now is not None else time.time()
+    pending = [a for a in outbox['pending'] if not (a['target'] == target and a['kind'] == kind)]
+    if outbox['last_message'].get(f"{target}|{kind}") == message and len(pending) == len(outbox['pending']):
+        return False
+    not_before = outbox['last_sent'].get(target, 0) + ALERT_MIN_INTERVAL_SECONDS
+    pending.append({
+        'target': target, 'kind': kind, 'message': message, 'status': status,
+        'created_at': now, 'attempts': 0, 'next_attempt_at': max(now, not_before),
+    })
+    outbox['pending'] = pending[-MAX_OUTBOX_ALERTS:]
+    return True
+
+def due_alerts(outbox, now, coalesce=True):
+    """Alerts ready to send. With `coalesce`, waits until the newest due alert has sat ALERT_COALESCE_SECONDS."""
+    due = [a for a in outbox['pending'] if a['next_attempt_at'] <= now]
+    if coalesce and due and now - max(a['created_at'] for a in due) < ALERT_COALESCE_SECONDS:
+        return []
+    return due
+
+def next_due_in(outbox, now):
+    """Seconds until the worker should look again (None when nothing is pending)."""
+    if not outbox['pending']: return None
+    wake_at = min(max(a['next_attempt_at'], a['created_at'] + ALERT_COALESCE_SECONDS) for a in outbox['pending'])
+    return max(0.0, wake_at - now)
+
+def format_digest(alerts):
+    """One message for many alerts: status changes grouped by new status, other alerts listed."""
+    if len(alerts) == 1: return alerts[0]['message']
+    by_status = {}
+    others = []
+    for alert in alerts:
+        if alert['kind'] == 'status' and alert.get('status'): by_status.setdefault(alert['status'], []).append(alert['target'])
+        else: others.append(alert['message'])
+    lines = [f"{len(alerts)} status updates:"]
+    for status, names in sorted(by_status.items(), key=lambda item: -len(item[1])):
+        shown = ', '.join(names[:DIGEST_MAX_NAMES]) + (f" and {len(names) - DIGEST_MAX_NAMES} more" if len(names) > DIGEST_MAX_NAMES else '')
+        lines.append(f"• {len(names)} target(s) now {status}: {shown}")
+    lines.extend(f"• {message}" for message in others)
+    return '\n'.join(lines)
+
+def drop_expired(outbox, now):
+    expired = [a for a in outbox['pending'] if now - a['created_at'] > MAX_ALERT_AGE_SECONDS]
+    if expired:
+        print(f"Dropping {len(expired)} alert(s) undelivered for over {MAX_ALERT_AGE_SECONDS // 3600}h")
+        outbox['pending'] = [a for a in outbox['pending'] if a not in expired]
+
+def mark_delivered(outbox, batch, now):
+    sent_ids = {id(a) for a in batch}
+    outbox['pending'] = [a for a in outbox['pending'] if id(a) not in sent_ids]
+    for alert in batch:
+        outbox['last_sent'][alert['target']] = now
+        outbox['last_message'][f"{alert['target']}|{alert['kind']}"] = alert['message']
+
+def mark_failed(outbox, batch, now):
+    """Backs the whole batch off together (so it stays one digest), doubling the delay per attempt."""
+    attempts = max(a['attempts'] for a in batch) + 1
+    retry_at = now + min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+    for alert in batch:
+        alert['attempts'] = attempts
+        alert['next_attempt_at'] = retry_at
+    print(f"Alert delivery failed, retrying {len(batch)} alert(s) with backoff (attempt {attempts})")
+
+def deliver_due(outbox, send, now=None, coalesce=True):
+    """Sends everything due as one message, synchronously. Returns the number of alerts sent."""
+    now = now if now is not None else time.time()
+    drop_expired(outbox, now)
+    batch = due_alerts(outbox, now, coalesce)
+    if not batch: return 0
+    if send(format_digest(batch)):
+        mark_delivered(outbox, batch, now)
+        return len(batch)
+    mark_failed(outbox, batch, now)
+    return 0
+
+# === BACKGROUND WORKER ===
+
+def init(send, filename=ALERT_OUTBOX_FILE):
+    """Loads the outbox and sets the delivery function (text -> bool)."""
+    global _outbox, _outbox_file, _send
+    with _lock:
+        _outbox_file = filename
+        _outbox = load_outbox(filename)
+        _send = send
+
+def enqueue_alerts(new_alerts):
+    """Queues alerts (dicts with target, kind, message and optional status) durably and wakes the worker.
+
+    Never blocks on delivery; the outbox is written once per call, so pass a whole sweep's alerts together.
+    """
+    if not new_alerts: return
+    with _lock:
+        added = [add_alert(_outbox, **alert) for alert in new_alerts]
+        if any(added): save_outbox(_outbox_file, _outbox)
+    _wakeup.set()
+
+def queue_depth():
+    with _lock:
+        return len(_outbox['pending'])
+
+def _run_worker():
+    while True:
+        stopping = _stop.is_set()
+        with _lock:
+            now = time.time()
+            drop_expired(_outbox, now)
+            batch = due_alerts(_outbox, now, coalesce=not stopping) if _send else []
+        if batch:
+            # Slack is called without the lock held so enqueue_alert never waits on the network
+            delivered = _send(format_digest(batch))
+            with _lock:
+                (mark_delivered if delivered else mark_failed)(_outbox, batch, time.time())
+        with _lock:
+            if batch or stopping: save_outbox(_outbox_file, _outbox)
+            wait = next_due_in(_outbox, time.time())
+        if stopping: break
+        _wakeup.wait(wait)
+        _wakeup.clear()
+
+def start():
+    """Starts the delivery worker thread (idempotent)."""
+    global _worker
+    if _worker is not None and _worker.is_alive(): return
+    _stop.clear()
+    _worker = threading.Thread(target=_run_worker, name='alert-worker', daemon=True)
+    _worker.start()
+
+def stop(timeout=10.0):
+    """Makes one last, uncoalesced delivery attempt for anything due, then stops the worker.
+
+    Alerts still pending (backing off or rate limited) stay in the outbox for the next run.
+    """
+    if _worker is None or not _worker.is_alive(): return
+    _stop.set()
+    _wakeup.set()
+    _worker.join(timeout)
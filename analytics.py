@@ -0,0 +1,280 @@
+# SLA and incident analytics for Status Snitch.
+# The check log is loaded into compact columns (epoch seconds, target and
+# status codes, float32 load times) and monthly reports are computed with
+# vectorized NumPy operations: uptime, incidents segmented from runs of
+# failing checks, MTTR/MTBF, and load time percentiles split into business
+# hours and off-hours in TARGET_TIMEZONE. Columns of finished log segments are
+# cached on disk, so a report over a year of checks only parses new segments.
+#   python analytics.py [--month 2026-09] [--target NAME] [--json]
+
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+import pytz
+import history_store
+import rollups
+
+try:
+    import numpy as np
+except ImportError: # Analytics are optional; the checker and dashboard run without NumPy
+    np = None
+
+# === CONFIGURATION ===
+TARGET_TIMEZONE = 'America/New_York' # Same zone as the dashboard; months and business hours are local
+ANALYTICS_CACHE_DIR = os.getenv('ANALYTICS_CACHE_DIR', '.analytics_cache')
+SLA_TARGET_PERCENT = float(os.getenv('SLA_TARGET_PERCENT', 99.9))
+BUSINESS_HOURS = (9, 17) # Local hours [start, end)
+BUSINESS_DAYS = (0, 1, 2, 3, 4) # Monday to Friday
+MAX_GAP_SECONDS = 3600 # A check's status stands until the next check, but no longer than this
+MIN_INCIDENT_CHECKS = 2 # Failing checks in a row that make an incident (the same rule as ALERT mode)
+PERCENTILES = (50, 90, 95, 99)
+STATUS_CODES = {'UP': 0, 'SLOW': 1, 'DEGRADED': 2, 'UNKNOWN': 3, 'ERROR': 4, 'DOWN': 5} # Ordered by severity
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+MAX_MEMORY_SEGMENTS = 24 * 400 # Segment columns kept in memory by a long-running process (api.py)
+
+_memory_cache = {} # segment path -> (signature, columns)
+
+# === COLUMN LOADING ===
+
+def require_numpy():
+    if np is None: raise RuntimeError("analytics needs NumPy (pip install numpy)")
+
+def _signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _parse_segment(path):
+    """Columns of one segment: names (target table), ts, target, status, latency."""
+    names, name_codes = [], {}
+    stamps, targets, statuses, latencies = [], [], [], []
+    for record in history_store.segment_records(path):
+        stamp = record.get('timestamp')
+        if not isinstance(stamp, str) or not stamp.endswith('Z'): continue
+        name = record.get('target')
+        code = name_codes.get(name)
+        if code is None:
+            code = name_codes[name] = len(names)
+            names.append(str(name))
+        rt = record.get('response_time')
+        stamps.append(stamp[:-1])
+        targets.append(code)
+        statuses.append(STATUS_CODES.get(record.get('status'), STATUS_CODES['UNKNOWN']))
+        latencies.append(rt if isinstance(rt, (int, float)) else 0.0)
+    try:
+        ts = np.array(stamps, dtype='datetime64[us]').astype(np.int64) / 1e6
+    except ValueError: # Not uniform ISO strings; parse one by one
+        ts = np.array([history_store.parse_timestamp(stamp + 'Z') for stamp in stamps], dtype=np.float64)
+    return {
+        'names': np.array(names, dtype=str), 'ts': ts, 'target': np.array(targets, dtype=np.int32),
+        'status': np.array(statuses, dtype=np.int8), 'latency': np.array(latencies, dtype=np.float32),
+    }
+
+def _cache_path(cache_dir, segment_path):
+    return os.path.join(cache_dir, os.path.basename(segment_path) + '.npz')
+
+def segment_columns(path, cache_dir=ANALYTICS_CACHE_DIR, persist=True):
+    """Columns of one segment, from memory or the on-disk cache when the segment is unchanged."""
+    signature = _signature(path)
+    cached = _memory_cache.get(path)
+    if cached is not None and cached[0] == signature: return cached[1]
+    columns = None
+    cache_file = _cache_path(cache_dir, path) if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as stored:
+                if tuple(stored['signature']) == signature: columns = {key: stored[key] for key in stored.files if key != 'signature'}
+        except (OSError, ValueError, KeyError):
+            columns = None
+    if columns is None:
+        columns = _parse_segment(path)
+        if cache_file and persist:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_file + '.tmp', 'wb') as f:
+                np.savez(f, signature=np.array(signature, dtype=np.int64), **columns)
+            os.replace(cache_file + '.tmp', cache_file)
+    if len(_memory_cache) >= MAX_MEMORY_SEGMENTS: _memory_cache.clear()
+    _memory_cache[path] = (signature, columns)
+    return columns
+
+def segments_in_range(history_dir, since=None, until=None):
+    """Segments (hour_key, part, path) that may hold checks in [since, until] (epoch seconds)."""
+    first_key = history_store.segment_hour(since - history_store.ORDER_SLACK_SECONDS) if since is not None else None
+    last_key = history_store.segment_hour(until + history_store.ORDER_SLACK_SECONDS) if until is not None else None
+    return [s for s in history_store.list_segments(history_dir) if (not first_key or s[0] >= first_key) and (not last_key or s[0] <= last_key)]
+
+def prune_cache(history_dir, cache_dir=ANALYTICS_CACHE_DIR):
+    """Deletes cached columns of segments that were compacted or pruned from the log."""
+    if not cache_dir or not os.path.isdir(cache_dir): return
+    live = {os.path.basename(path) + '.npz' for _, _, path in history_store.list_segments(history_dir)}
+    for entry in os.listdir(cache_dir):
+        if entry.endswith('.npz') and entry not in live: os.remove(os.path.join(cache_dir, entry))
+
+def load_columns(history_dir, since=None, until=None, target=None, cache_dir=ANALYTICS_CACHE_DIR):
+    """Checks in [since, until) as columns sorted by (target, ts), with `names` mapping target codes to names."""
+    require_numpy()
+    segments = segments_in_range(history_dir, since, until)
+    names, name_codes, parts = [], {}, []
+    for index, (_, _, path) in enumerate(segments):
+        try:
+            # The newest segment is still being appended to, so it is not written to the disk cache
+            columns = segment_columns(path, cache_dir, persist=index < len(segments) - 1 or path.endswith('.gz'))
+        except (IOError, EOFError):
+            continue # Compacted or pruned underneath us
+        if not len(columns['ts']): continue
+        for name in columns['names']:
+            if name not in name_codes:
+                name_codes[name] = len(names)
+                names.append(str(name))
+        mapping = np.array([name_codes[name] for name in columns['names']], dtype=np.int32)
+        parts.append((columns['ts'], mapping[columns['target']], columns['status'], columns['latency']))
+    if parts:
+        ts, codes, status, latency = (np.concatenate(column) for column in zip(*parts))
+    else:
+        ts, codes, status, latency = np.zeros(0), np.zeros(0, np.int32), np.zeros(0, np.int8), np.zeros(0, np.float32)
+    keep = np.ones(len(ts), dtype=bool)
+    if since is not None: keep &= ts >= since
+    if until is not None: keep &= ts < until
+    if target is not None: keep &= codes == name_codes.get(target, -1)
+    ts, codes, status, latency = ts[keep], codes[keep], status[keep], latency[keep]
+    order = np.lexsort((ts, codes))
+    return {'names': names, 'ts': ts[order], 'target': codes[order], 'status': status[order], 'latency': latency[order]}
+
+# === REPORTS ===
+
+def month_bounds(month, tz):
+    """(start, end) epoch seconds of a 'YYYY-MM' month in the given timezone."""
+    year, month_number = (int(part) for part in month.split('-'))
+    start = tz.localize(datetime(year, month_number, 1))
+    end = tz.localize(datetime(year + month_number // 12, month_number % 12 + 1, 1))
+    return start.timestamp(), end.timestamp()
+
+def report_period(month=None, tz_name=TARGET_TIMEZONE, now=None):
+    """(month, start, period_end, month_end) for a report; the current month ends at `now`."""
+    tz = pytz.timezone(tz_name)
+    now = now if now is not None else datetime.now(timezone.utc).timestamp()
+    month = month or datetime.fromtimestamp(now, tz).strftime('%Y-%m')
+    start, end = month_bounds(month, tz)
+    return month, start, min(end, now), end
+
+def business_hours_mask(ts, tz):
+    """True for checks taken during local business hours. Offsets are looked up once per distinct UTC hour."""
+    hours = (ts // 3600).astype(np.int64)
+    unique_hours, inverse = np.unique(hours, return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(int(h) * 3600, tz).utcoffset().total_seconds() for h in unique_hours])
+    local = ts + (offsets[inverse] if len(offsets) else 0)
+    local_hour = (local // 3600).astype(np.int64) % 24
+    local_weekday = ((local // 86400).astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday; Monday is 0
+    return np.isin(local_weekday, BUSINESS_DAYS) & (local_hour >= BUSINESS_HOURS[0]) & (local_hour < BUSINESS_HOURS[1])
+
+def latency_percentiles(latency):
+    if not len(latency): return {f"p{p}": None for p in PERCENTILES} | {'checks': 0}
+    values = np.percentile(latency, PERCENTILES)
+    return {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, values)} | {'checks': int(len(latency))}
+
+def segment_incidents(ts, status, up, period_end):
+    """Incidents from runs of at least MIN_INCIDENT_CHECKS failing checks. An incident ends at the first healthy check."""
+    edges = np.diff(np.concatenate(([0], (~up).astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) # Index of the recovering check (len(ts) while still failing)
+    keep = ends - starts >= MIN_INCIDENT_CHECKS
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts): return []
+    # Reduce over [start, end) only: interleave the bounds and keep every other result (the sentinel makes end == len valid)
+    worst = np.maximum.reduceat(np.append(status, status[:1]), np.column_stack((starts, ends)).ravel())[::2]
+    incidents = []
+    for start, end, worst_code in zip(starts.tolist(), ends.tolist(), worst.tolist()):
+        ongoing = end >= len(ts)
+        end_ts = None if ongoing else float(ts[end])
+        incidents.append({
+            'start': _iso(ts[start]), 'end': _iso(end_ts) if end_ts is not None else None, 'ongoing': ongoing,
+            'duration_seconds': round((end_ts if end_ts is not None else period_end) - float(ts[start]), 1),
+            'checks': end - start, 'status': STATUS_NAMES[worst_code],
+        })
+    return incidents
+
+def _iso(ts_epoch):
+    return datetime.fromtimestamp(float(ts_epoch), timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def target_report(ts, status, latency, business, period_end):
+    """SLA figures for one target's checks (sorted by time) within a period."""
+    up = np.isin(status, [STATUS_CODES[s] for s in rollups.UP_STATUSES])
+    # Each check covers the time until the next one, capped so monitoring gaps count as unobserved
+    covered = np.minimum(np.diff(np.append(ts, period_end)), MAX_GAP_SECONDS).clip(min=0)
+    observed = float(covered.sum())
+    up_seconds = float(covered[up].sum())
+    incidents = segment_incidents(ts, status, up, period_end)
+    resolved = [i['duration_seconds'] for i in incidents if not i['ongoing']]
+    uptime = round(100.0 * up_seconds / observed, 4) if observed else None
+    timed = up & (latency > 0)
+    return {
+        'checks': int(len(ts)), 'observed_seconds': round(observed, 1), 'downtime_seconds': round(observed - up_seconds, 1),
+        'uptime_percent': uptime, 'sla_target_percent': SLA_TARGET_PERCENT,
+        'sla_met': uptime >= SLA_TARGET_PERCENT if uptime is not None else None,
+        'incident_count': len(incidents),
+        'mttr_seconds': round(sum(resolved) / len(resolved), 1) if resolved else None,
+        'mtbf_seconds': round(up_seconds / len(incidents), 1) if incidents else None,
+        'latency': {
+            'business_hours': latency_percentiles(latency[timed & business]),
+            'off_hours': latency_percentiles(latency[timed & ~business]),
+        },
+        'incidents': incidents,
+    }
+
+def sla_report(history_dir, month=None, target=None, tz_name=TARGET_TIMEZONE, now=None, cache_dir=ANALYTICS_CACHE_DIR):
+    """Monthly SLA report for every target (or one), month-to-date for the current month."""
+    require_numpy()
+    tz = pytz.timezone(tz_name)
+    month, start, period_end, end = report_period(month, tz_name, now)
+    columns = load_columns(history_dir, start, period_end, target, cache_dir)
+    business = business_hours_mask(columns['ts'], tz)
+    bounds = np.searchsorted(columns['target'], np.arange(len(columns['names']) + 1))
+    targets = {}
+    for code, name in enumerate(columns['names']):
+        lo, hi = bounds[code], bounds[code + 1]
+        if lo == hi: continue
+        targets[name] = target_report(columns['ts'][lo:hi], columns['status'][lo:hi], columns['latency'][lo:hi], business[lo:hi], period_end)
+    return {
+        'month': month, 'timezone': tz_name, 'start': _iso(start), 'end': _iso(period_end), 'complete': period_end >= end,
+        'business_hours': {'days': 'Mon-Fri', 'hours': list(BUSINESS_HOURS)}, 'targets': dict(sorted(targets.items())),
+    }
+
+def format_duration(seconds):
+    if seconds is None: return '-'
+    days, rest = divmod(int(seconds), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    if days: return f"{days}d {hours}h"
+    if hours: return f"{hours}h {minutes}m"
+    if minutes: return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
+def format_report(report):
+    lines = [f"SLA report {report['month']} ({report['timezone']}, {report['start']} .. {report['end']}{'' if report['complete'] else ', month to date'})"]
+    for name, t in report['targets'].items():
+        verdict = 'met' if t['sla_met'] else 'missed'
+        uptime = f"{t['uptime_percent']:.3f}%" if t['uptime_percent'] is not None else '-'
+        lines.append(f"{name}: uptime {uptime} (SLA {t['sla_target_percent']}% {verdict}), {t['incident_count']} incident(s), "
+                     f"MTTR {format_duration(t['mttr_seconds'])}, MTBF {format_duration(t['mtbf_seconds'])}, {t['checks']} checks")
+        for label, key in (('business hours', 'business_hours'), ('off-hours', 'off_hours')):
+            p = t['latency'][key]
+            if p['checks']: lines.append(f"  {label}: p50 {p['p50']:.3f}s  p95 {p['p95']:.3f}s  p99 {p['p99']:.3f}s  ({p['checks']} checks)")
+        for incident in t['incidents']:
+            until = incident['end'] or 'ongoing'
+            lines.append(f"  incident {incident['start']} .. {until}  {format_duration(incident['duration_seconds'])}, {incident['status']}, {incident['checks']} checks")
+    if not report['targets']: lines.append("No checks in this period.")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monthly SLA and incident report from the check log.')
+    parser.add_argument('--history-dir', default=os.getenv('HISTORY_DIR', history_store.HISTORY_DIR))
+    parser.add_argument('--month', help='YYYY-MM in the report timezone (default: this month, to date)')
+    parser.add_argument('--target', help='only report this target')
+    parser.add_argument('--timezone', default=TARGET_TIMEZONE, help='timezone for month boundaries and business hours')
+    parser.add_argument('--cache-dir', default=ANALYTICS_CACHE_DIR, help="cached segment columns ('' to disable)")
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    report = sla_report(args.history_dir, args.month, args.target, args.timezone, cache_dir=args.cache_dir or None)
+    if args.cache_dir: prune_cache(args.history_dir, args.cache_dir)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
@@ -0,0 +1,138 @@
+# Adaptive slowness detection for Status Snitch.
+# Each target keeps exponentially weighted baselines of log load time (one
+# overall, one per UTC hour-of-day and one per UTC hour-of-week) and a one-sided CUSUM of how far checks sit
+# above that baseline. A sustained departure flags the target DEGRADED even
+# when it is still under the fixed SLOW threshold, while a target that is
+# always slow stays quiet. Updates are O(1) and the state is a few KB per target.
+# Replay over the check log to tune sensitivity offline:
+#   python anomaly.py [--target NAME] [--since 2026-08-01] [--k 0.5] [--h 8] [--json]
+
+import argparse
+import json
+import math
+import os
+import history_store
+
+# === CONFIGURATION ===
+GLOBAL_ALPHA = 0.02 # EWMA weight per check for the overall baseline (half-life ~35 checks)
+SLOT_ALPHA = 0.1 # EWMA weight for an hour-of-week slot (each slot sees few checks per week)
+WARMUP_CHECKS = 20 # Checks needed before the overall baseline is trusted
+MIN_SLOT_CHECKS = 12 # Checks needed before a slot's mean is preferred (hour-of-week, else hour-of-day, else overall)
+MIN_STD = 0.05 # Floor on baseline spread in log space (~5%), so very steady targets do not flag noise
+CUSUM_K = 0.5 # Allowance: deviations below this many standard deviations do not accumulate
+CUSUM_H = 8.0 # Decision threshold: DEGRADED once the cumulative excess passes this
+MAX_STEP_FRACTION = 0.5 # One check adds at most this share of CUSUM_H, so a lone spike cannot cross the threshold
+CLIP_Z = 3.0 # Samples are clipped to this many standard deviations before updating baselines
+HOURS_PER_WEEK = 168
+WEEK_ALIGN_SECONDS = 4 * 86400 # 1970-01-05 was a Monday; slot 0 is Monday 00:00 UTC
+
+# === DETECTOR ===
+
+def new_detector():
+    return {'global': [0, 0.0, 0.0], 'hours': {}, 'slots': {}, 'cusum': 0.0, 'degraded': False}
+
+def hour_of_week(ts_epoch):
+    return int((ts_epoch - WEEK_ALIGN_SECONDS) // 3600) % HOURS_PER_WEEK
+
+def _update_baseline(baseline, value, alpha):
+    """EWMA mean/variance update of [count, mean, var]; behaves as a plain average until 1/alpha samples."""
+    count, mean, var = baseline
+    weight = max(alpha, 1.0 / (count + 1))
+    diff = value - mean
+    mean += weight * diff
+    var = (1 - weight) * (var + weight * diff * diff)
+    baseline[:] = [count + 1, round(mean, 6), round(var, 8)]
+
+def observe(detector, ts_epoch, latency):
+    """Folds one check's load time into the detector (in place). O(1).
+
+    `latency` is None for checks without a usable load time (DOWN/ERROR),
+    which leave the baselines untouched. Returns a verdict dict: degraded
+    (the detector is in a degraded episode and this check is itself above
+    baseline), warm (a baseline exists), z (standard deviations above
+    baseline) and expected (baseline load time in seconds).
+    """
+    verdict = {'degraded': detector['degraded'], 'warm': detector['global'][0] >= WARMUP_CHECKS, 'z': None, 'expected': None}
+    if latency is None or latency <= 0: return verdict
+    value = math.log(latency)
+    week_slot_key = hour_of_week(ts_epoch)
+    week_slot = detector['slots'].setdefault(str(week_slot_key), [0, 0.0, 0.0])
+    day_slot = detector.setdefault('hours', {}).setdefault(str(week_slot_key % 24), [0, 0.0, 0.0])
+    # Daily patterns are learned within a day, weekly ones once each hour of the week has been seen
+    slot = week_slot if week_slot[0] >= MIN_SLOT_CHECKS else day_slot if day_slot[0] >= MIN_SLOT_CHECKS else None
+    mean = slot[1] if slot else detector['global'][1]
+    if verdict['warm']:
+        # A slot sees few checks, so its spread is never trusted below the overall one
+        std = max(math.sqrt(detector['global'][2]), math.sqrt(slot[2]) if slot else 0.0, MIN_STD)
+        z = (value - mean) / std
+        cusum = min(max(0.0, detector['cusum'] + min(z, MAX_STEP_FRACTION * CUSUM_H) - CUSUM_K), 2 * CUSUM_H) # Capped so recovery is prompt
+        # Hysteresis: enter above H, leave once the excess has drained below H/2
+        detector['degraded'] = cusum > CUSUM_H or (detector['degraded'] and cusum > CUSUM_H / 2)
+        detector['cusum'] = round(cusum, 4)
+        # While the excess drains, checks back near the baseline are not themselves degraded
+        verdict.update(degraded=detector['degraded'] and z > CUSUM_K, z=round(z, 2), expected=round(math.exp(mean), 3))
+        # Clip before learning so one incident does not drag the baseline; sustained shifts still adapt
+        value = min(max(value, mean - CLIP_Z * std), mean + CLIP_Z * std)
+    _update_baseline(detector['global'], value, GLOBAL_ALPHA)
+    _update_baseline(day_slot, value, SLOT_ALPHA)
+    _update_baseline(week_slot, value, SLOT_ALPHA)
+    return verdict
+
+# === OFFLINE REPLAY ===
+
+def replay(history_dir, target=None, since=None, until=None):
+    """Runs fresh detectors over the check log. Returns {target: summary with DEGRADED episodes}."""
+    since_epoch = history_store.parse_timestamp(since) if isinstance(since, str) else since
+    until_epoch = history_store.parse_timestamp(until) if isinstance(until, str) else until
+    detectors, summaries = {}, {}
+    for _, record in history_store.iter_positions(history_dir):
+        name = record.get('target')
+        if target is not None and name != target: continue
+        try:
+            ts_epoch = history_store.parse_timestamp(record['timestamp'])
+        except (KeyError, ValueError, AttributeError):
+            continue
+        if until_epoch is not None and ts_epoch > until_epoch: continue
+        detector = detectors.setdefault(name, new_detector())
+        summary = summaries.setdefault(name, {'checks': 0, 'judged': 0, 'degraded_checks': 0, 'slow_checks': 0, 'episodes': []})
+        rt = record.get('response_time')
+        latency = rt if record.get('status') in ('UP', 'SLOW', 'DEGRADED') and isinstance(rt, (int, float)) and rt > 0 else None
+        was_degraded = detector['degraded']
+        verdict = observe(detector, ts_epoch, latency)
+        if since_epoch is not None and ts_epoch < since_epoch: continue # Still warms the baselines
+        summary['checks'] += 1
+        if verdict['z'] is not None: summary['judged'] += 1
+        if record.get('status') == 'SLOW': summary['slow_checks'] += 1
+        if verdict['degraded'] and latency is not None: # DOWN/ERROR keep their own status
+            summary['degraded_checks'] += 1
+            if not was_degraded or not summary['episodes']:
+                summary['episodes'].append({'start': record['timestamp'], 'end': record['timestamp'], 'checks': 0, 'peak_z': 0.0, 'expected': verdict['expected']})
+            episode = summary['episodes'][-1]
+            episode['end'] = record['timestamp']
+            episode['checks'] += 1
+            if verdict['z'] is not None: episode['peak_z'] = max(episode['peak_z'], verdict['z'])
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay the check log through the anomaly detector to tune its sensitivity.')
+    parser.add_argument('--history-dir', default=os.getenv('HISTORY_DIR', history_store.HISTORY_DIR))
+    parser.add_argument('--target', help='only replay this target')
+    parser.add_argument('--since', help='first check to report (earlier checks still train the baselines)')
+    parser.add_argument('--until', help='last check to replay')
+    parser.add_argument('--k', type=float, default=CUSUM_K, help='CUSUM allowance in standard deviations')
+    parser.add_argument('--h', type=float, default=CUSUM_H, help='CUSUM decision threshold')
+    parser.add_argument('--global-alpha', type=float, default=GLOBAL_ALPHA)
+    parser.add_argument('--slot-alpha', type=float, default=SLOT_ALPHA)
+    parser.add_argument('--min-std', type=float, default=MIN_STD)
+    parser.add_argument('--json', action='store_true', help='print the full summary as JSON')
+    args = parser.parse_args()
+    CUSUM_K, CUSUM_H, GLOBAL_ALPHA, SLOT_ALPHA, MIN_STD = args.k, args.h, args.global_alpha, args.slot_alpha, args.min_std
+    results = replay(args.history_dir, args.target, args.since, args.until)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, summary in sorted(results.items()):
+            print(f"{name}: {summary['checks']} checks, {summary['degraded_checks']} DEGRADED in {len(summary['episodes'])} episode(s), {summary['slow_checks']} SLOW")
+            for episode in summary['episodes']:
+                print(f"  {episode['start']} .. {episode['end']}  {episode['checks']} checks, peak z {episode['peak_z']:.1f}, baseline {episode['expected']}s")
@@ -1,19 +1,425 @@
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify, request, Response, stream_with_context
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import gzip
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+import history_store
+import rollups
+import analytics
+import alerts
+import metrics
 
 STATE_FILE = os.environ.get('STATE_FILE', 'status.json')
+ROLLUPS_DIR = os.environ.get('ROLLUPS_DIR', rollups.ROLLUPS_DIR)
+HISTORY_DIR = os.environ.get('HISTORY_DIR', history_store.HISTORY_DIR)
+ALERT_OUTBOX_FILE = os.environ.get('ALERT_OUTBOX_FILE', alerts.ALERT_OUTBOX_FILE)
+DEFAULT_HISTORY_LIMIT = 500
+MAX_HISTORY_LIMIT = 5000
+GZIP_MIN_BYTES = 1024
+STREAM_POLL_SECONDS = 0.5 # How often the log tailer looks for new records
+STREAM_HEARTBEAT_SECONDS = 15 # Idle subscribers get a comment line this often
+STREAM_BUFFER_EVENTS = 2000 # Recent events kept in memory for Last-Event-ID resume
+STREAM_MAX_REPLAY = 5000 # Older resumes are replayed from the log up to this many records
+STREAM_ALLOW_ORIGIN = os.environ.get('STREAM_ALLOW_ORIGIN', '*') # The static dashboard is served from another origin
 app = Flask(__name__)
 
-@app.route('/status')
-def status():
+_file_cache = {} # path -> {'signature', 'data', 'body', 'etag', 'last_modified'}
+_derived_cache = {} # (endpoint, signatures, args) -> serialized body
+_gzip_cache = {} # etag -> gzip-compressed body
+_cache_lock = threading.Lock()
+
+_stream_events = deque(maxlen=STREAM_BUFFER_EVENTS) # (position, event_type, payload_json)
+_stream_condition = threading.Condition()
+_stream_tailer = None
+LOG_START = ('', 0, 0) # Sorts before every real log position
+
+# === CACHING HELPERS ===
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it does not exist. One stat per request."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def cached_json_file(path):
+    """Parsed contents of a JSON file, re-read only when its mtime or size changes."""
+    signature = file_signature(path)
+    entry = _file_cache.get(path)
+    if entry is not None and entry['signature'] == signature:
+        return entry
     try:
-        with open(STATE_FILE, 'r') as f:
+        with open(path, 'r') as f:
             data = json.load(f)
     except Exception:
         data = {}
-    return jsonify(data)
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    mtime = datetime.fromtimestamp(signature[0] / 1e9, timezone.utc) if signature else datetime.now(timezone.utc)
+    entry = {
+        'signature': signature, 'data': data, 'body': body,
+        'etag': hashlib.sha1(body).hexdigest(), 'last_modified': mtime.replace(microsecond=0),
+    }
+    with _cache_lock:
+        _file_cache[path] = entry
+    return entry
+
+def cached_rollups(target=None):
+    """Rollups of one target (or all) as {'data': {name: rollups}, 'etag', 'last_modified'}, from cached per-target files."""
+    if target is not None: paths = [rollups.rollup_path(ROLLUPS_DIR, target)]
+    elif os.path.isdir(ROLLUPS_DIR): paths = [os.path.join(ROLLUPS_DIR, f) for f in sorted(os.listdir(ROLLUPS_DIR)) if f.endswith('.json')]
+    else: paths = []
+    entries = [cached_json_file(path) for path in paths]
+    data = {str(e['data']['target']): e['data']['rollups'] for e in entries if isinstance(e['data'].get('rollups'), dict) and 'target' in e['data']}
+    return {
+        'data': data, 'etag': hashlib.sha1(''.join(e['etag'] for e in entries).encode('ascii')).hexdigest(),
+        'last_modified': max((e['last_modified'] for e in entries), default=datetime.fromtimestamp(0, timezone.utc)),
+    }
+
+def cached_derived(key, build):
+    """Memoizes a derived JSON body for a key that embeds the signatures of its source files."""
+    body = _derived_cache.get(key)
+    if body is None:
+        body = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+        with _cache_lock:
+            if len(_derived_cache) > 256: _derived_cache.clear()
+            _derived_cache[key] = body
+    return body
+
+def json_response(body, etag=None, last_modified=None):
+    """Returns a JSON body with validators, answering 304 and gzip-encoding when the client allows."""
+    etag = etag or hashlib.sha1(body).hexdigest()
+    if request.if_none_match and request.if_none_match.contains(etag):
+        return not_modified(etag, last_modified)
+    if last_modified is not None and not request.if_none_match and request.headers.get('If-Modified-Since'):
+        try:
+            if last_modified <= parsedate_to_datetime(request.headers['If-Modified-Since']):
+                return not_modified(etag, last_modified)
+        except (TypeError, ValueError):
+            pass
+    response = Response(body, mimetype='application/json')
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        compressed = _gzip_cache.get(etag)
+        if compressed is None:
+            compressed = gzip.compress(body, compresslevel=5)
+            with _cache_lock:
+                if len(_gzip_cache) > 256: _gzip_cache.clear()
+                _gzip_cache[etag] = compressed
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    if last_modified is not None: response.headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+    return response
+
+def not_modified(etag, last_modified):
+    response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None: response.headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+    return response
+
+def bad_request(message):
+    response = jsonify({'error': message})
+    response.status_code = 400
+    return response
+
+def parse_time_arg(value):
+    """Parses a since/until argument given as epoch seconds or an ISO timestamp."""
+    if value is None or value == '': return None
+    try:
+        return float(value)
+    except ValueError:
+        return history_store.parse_timestamp(value)
+
+def parse_window(value):
+    """Parses a rollup window such as '24h', '7d', '90m' or plain seconds."""
+    if value in rollups.WINDOWS: return rollups.WINDOWS[value]
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhdw]?)', value or '')
+    if not match: raise ValueError(f"invalid window '{value}'")
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}[match.group(2)]
+
+def state_now_epoch(state):
+    """Reference time for window queries: the last recorded check, so results only change with the data."""
+    last_check = state.get('last_check_timestamp_utc')
+    try:
+        return history_store.parse_timestamp(last_check) if last_check else datetime.now(timezone.utc).timestamp()
+    except ValueError:
+        return datetime.now(timezone.utc).timestamp()
+
+def history_signature():
+    """Cheap change marker for the check log: the newest segment's name, mtime and size."""
+    segments = history_store.list_segments(HISTORY_DIR)
+    if not segments: return None
+    return (segments[-1][2], file_signature(segments[-1][2]))
+
+# === LIVE STREAM HELPERS ===
+
+def format_event_id(position):
+    hour_key, part, offset = position
+    return f"{hour_key}.{part}.{offset}"
+
+def parse_event_id(event_id):
+    """Parses a Last-Event-ID back into a log position, or None if it is not one of ours."""
+    match = re.fullmatch(r'(\d{8}T\d{2})\.(\d+)\.(\d+)', event_id or '')
+    return (match.group(1), int(match.group(2)), int(match.group(3))) if match else None
+
+def events_for_record(record, last_status):
+    """SSE events for one logged check: a 'transition' when its status changed, then the 'check'."""
+    events = []
+    target = record.get('target')
+    previous = last_status.get(target)
+    if previous is not None and previous != record.get('status'):
+        events.append(('transition', json.dumps({'target': target, 'from': previous, 'to': record.get('status'), 'timestamp': record.get('timestamp')})))
+    last_status[target] = record.get('status')
+    events.append(('check', json.dumps(record)))
+    return events
+
+def tail_check_log():
+    """Follows the check log and publishes each appended record to stream subscribers.
+
+    One thread serves every subscriber; it starts at the end of the log, so
+    the daemon's per-check appends reach clients within STREAM_POLL_SECONDS.
+    """
+    position = history_store.end_position(HISTORY_DIR)
+    last_status = {name: t.get('status') for name, t in cached_json_file(STATE_FILE)['data'].get('targets', {}).items()}
+    while True:
+        published = []
+        for position, record in history_store.iter_positions(HISTORY_DIR, position):
+            published.extend((position, event_type, payload) for event_type, payload in events_for_record(record, last_status))
+        if published:
+            with _stream_condition:
+                _stream_events.extend(published)
+                _stream_condition.notify_all()
+        time.sleep(STREAM_POLL_SECONDS)
+
+def ensure_stream_tailer():
+    global _stream_tailer
+    with _cache_lock:
+        if _stream_tailer is None or not _stream_tailer.is_alive():
+            _stream_tailer = threading.Thread(target=tail_check_log, name='stream-tailer', daemon=True)
+            _stream_tailer.start()
+
+def format_sse(event_type, payload, position=None):
+    lines = f"event: {event_type}\n"
+    if position is not None and event_type == 'check': lines += f"id: {format_event_id(position)}\n"
+    return f"{lines}data: {payload}\n\n"
+
+def events_after(cursor):
+    """Buffered events newer than `cursor`; walks back from the newest, so cost is the number returned."""
+    newer = []
+    for event in reversed(_stream_events):
+        if event[0] <= cursor: break
+        newer.append(event)
+    newer.reverse()
+    return newer
+
+def replay_events(resume_from):
+    """Events after `resume_from`, from memory when the buffer still covers it, otherwise from the log.
+
+    Returns (events, complete). A log replay stops after STREAM_MAX_REPLAY
+    events; it is incomplete when the buffer does not reach back to where it stopped.
+    """
+    with _stream_condition:
+        buffered = list(_stream_events)
+    if buffered and buffered[0][0] <= resume_from:
+        return [event for event in buffered if event[0] > resume_from], True
+    replayed, last_status = [], {}
+    for position, record in history_store.iter_positions(HISTORY_DIR, resume_from):
+        replayed.extend((position, event_type, payload) for event_type, payload in events_for_record(record, last_status))
+        if len(replayed) >= STREAM_MAX_REPLAY:
+            with _stream_condition:
+                return replayed, bool(_stream_events) and _stream_events[0][0] <= position
+    return replayed, True
+
+# === SELF-MONITORING ===
+
+def published_state_metrics():
+    """Scrape-time gauges from the files the checker publishes: target status, latest load time, alert backlog."""
+    samples = []
+    for name, target_state in cached_json_file(STATE_FILE)['data'].get('targets', {}).items():
+        if not isinstance(target_state, dict): continue
+        for status in metrics.STATUSES:
+            samples.append(('snitch_target_status', {'target': name, 'status': status}, 1 if target_state.get('status') == status else 0))
+        if isinstance(target_state.get('response_time'), (int, float)):
+            samples.append(('snitch_target_response_seconds', {'target': name}, target_state['response_time']))
+    pending = cached_json_file(ALERT_OUTBOX_FILE)['data'].get('pending')
+    samples.append(('snitch_alert_queue_depth', {}, len(pending) if isinstance(pending, list) else 0))
+    return samples
+
+
+if metrics.ENABLED:
+    # Only hooked in when enabled, so a disabled API pays nothing per request
+    metrics.register_collector(published_state_metrics)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.observe('snitch_api_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint, code=response.status_code)
+        return response
+
+
+# === ENDPOINTS ===
+
+@app.route('/status')
+def status():
+    entry = cached_json_file(STATE_FILE)
+    return json_response(entry['body'], entry['etag'], entry['last_modified'])
+
+@app.route('/summary')
+def summary():
+    state_entry = cached_json_file(STATE_FILE)
+    rollups_entry = cached_rollups()
+
+    def build():
+        now_epoch = state_now_epoch(state_entry['data'])
+        targets = {}
+        for name, target_state in state_entry['data'].get('targets', {}).items():
+            day = rollups.query_window(rollups_entry['data'].get(name, {}), rollups.WINDOWS['24h'], now_epoch)
+            targets[name] = {
+                'url': target_state.get('url'), 'status': target_state.get('status'),
+                'response_time': target_state.get('response_time'), 'extra_info': target_state.get('extra_info'),
+                'alert_mode': target_state.get('alert_mode'), 'last_check_timestamp_utc': target_state.get('last_check_timestamp_utc'),
+                'uptime_24h': day['uptime_percent'], 'p50_24h': day['p50'], 'p95_24h': day['p95'], 'p99_24h': day['p99'],
+            }
+        return {'last_check_timestamp_utc': state_entry['data'].get('last_check_timestamp_utc'), 'targets': targets}
+
+    body = cached_derived(('summary', state_entry['etag'], rollups_entry['etag']), build)
+    return json_response(body, last_modified=max(state_entry['last_modified'], rollups_entry['last_modified']))
+
+@app.route('/rollups')
+def rollup_window():
+    try:
+        window_seconds = parse_window(request.args.get('window', '24h'))
+    except ValueError as e:
+        return bad_request(str(e))
+    target = request.args.get('target')
+    state_entry = cached_json_file(STATE_FILE)
+    rollups_entry = cached_rollups(target)
+
+    def build():
+        now_epoch = state_now_epoch(state_entry['data'])
+        names = [target] if target else list(rollups_entry['data'])
+        return {
+            'window_seconds': window_seconds,
+            'targets': {name: rollups.query_window(rollups_entry['data'].get(name, {}), window_seconds, now_epoch) for name in names},
+        }
+
+    body = cached_derived(('rollups', state_entry['etag'], rollups_entry['etag'], window_seconds, target), build)
+    return json_response(body, last_modified=rollups_entry['last_modified'])
+
+@app.route('/history')
+def history():
+    try:
+        since = parse_time_arg(request.args.get('since'))
+        until = parse_time_arg(request.args.get('until'))
+        limit = min(int(request.args.get('limit', DEFAULT_HISTORY_LIMIT)), MAX_HISTORY_LIMIT)
+    except ValueError as e:
+        return bad_request(f"invalid query: {e}")
+    if limit <= 0: return bad_request("limit must be positive")
+    if since is None:
+        # Default to the trailing day, aligned to the minute so repeated polls share a cache entry
+        since = (until if until is not None else datetime.now(timezone.utc).timestamp() // 60 * 60) - rollups.WINDOWS['24h']
+    target = request.args.get('target')
+
+    def build():
+        records = history_store.read_history(HISTORY_DIR, since=since, until=until, target=target, limit=limit)
+        return {'since': since, 'until': until, 'count': len(records), 'truncated': len(records) >= limit, 'records': records}
+
+    # Keyed on the newest segment, so a cached page is dropped as soon as a check is appended
+    body = cached_derived(('history', history_signature(), since, until, target, limit), build)
+    return json_response(body)
+
+@app.route('/sla')
+def sla():
+    """Monthly SLA report (uptime, incidents, MTTR/MTBF, business vs off-hours percentiles); see analytics.py."""
+    if analytics.np is None:
+        response = jsonify({'error': 'SLA reports need NumPy on the API server'})
+        response.status_code = 501
+        return response
+    month = request.args.get('month')
+    if month is not None and not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', month): return bad_request("month must be YYYY-MM")
+    target = request.args.get('target')
+    state_entry = cached_json_file(STATE_FILE)
+    now_epoch = state_now_epoch(state_entry['data'])
+    month, start, period_end, _ = analytics.report_period(month, now=now_epoch)
+    # Keyed on the period's segments, so a finished month stays cached while checks are appended
+    source = [(path, file_signature(path)) for _, _, path in analytics.segments_in_range(HISTORY_DIR, start, period_end)]
+
+    def build():
+        return analytics.sla_report(HISTORY_DIR, month, target, now=period_end)
+
+    body = cached_derived(('sla', month, target, period_end, hashlib.sha1(repr(source).encode('utf-8')).hexdigest()), build)
+    return json_response(body)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """OpenMetrics exposition (classic Prometheus text unless the scraper asks for OpenMetrics)."""
+    if not metrics.ENABLED:
+        response = jsonify({'error': 'metrics are disabled (set METRICS_ENABLED=1)'})
+        response.status_code = 404
+        return response
+    openmetrics = metrics.wants_openmetrics(request.headers.get('Accept'))
+    return Response(metrics.render(openmetrics), content_type=metrics.OPENMETRICS_CONTENT_TYPE if openmetrics else metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events: a 'check' event per recorded check and a 'transition' per status change.
+
+    Clients reconnecting with Last-Event-ID (or ?last_event_id=) get the
+    events they missed first; when more were missed than can be replayed,
+    a 'reset' event tells them to re-fetch /status. Idle connections receive a heartbeat comment.
+    """
+    ensure_stream_tailer()
+    resume_from = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+
+    def generate():
+        yield f"retry: {int(STREAM_POLL_SECONDS * 4000)}\n\n"
+        cursor = resume_from
+        if cursor is not None:
+            replayed, complete = replay_events(cursor)
+            for position, event_type, payload in replayed:
+                yield format_sse(event_type, payload, position)
+                cursor = position
+            if not complete:
+                # Too far behind to replay: say so rather than skip to the buffer silently
+                with _stream_condition:
+                    cursor = _stream_events[-1][0] if _stream_events else LOG_START
+                yield format_sse('reset', json.dumps({'reason': 'replay limit reached', 'refetch': '/status'}))
+        if cursor is None:
+            # New subscriber: only what is recorded from now on
+            with _stream_condition:
+                cursor = _stream_events[-1][0] if _stream_events else LOG_START
+        while True:
+            with _stream_condition:
+                pending = events_after(cursor)
+                if not pending:
+                    _stream_condition.wait(STREAM_HEARTBEAT_SECONDS)
+                    pending = events_after(cursor)
+            if not pending:
+                yield ": heartbeat\n\n"
+                continue
+            for position, event_type, payload in pending:
+                yield format_sse(event_type, payload, position)
+                cursor = position
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Access-Control-Allow-Origin'] = STREAM_ALLOW_ORIGIN
+    return response
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8000)))
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8000)), threaded=True)
@@ -0,0 +1,363 @@
+# Benchmarks for Status Snitch's state, rendering, storage and API hot paths.
+# Generates synthetic check logs from 10^2 up to --max-records records (status
+# mixes with incident runs, realistic latencies and timestamps), then times each
+# hot path with perf_counter and measures its peak memory with tracemalloc.
+# Probe overhead per check is measured against the local stub server.
+# Usage: python bench.py [--max-records 100000] [--max-tail 10000] [--json results.json] [--baseline old.json]
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import requests
+import analytics
+import api
+import check_status
+import data_shards
+import history_store
+import metrics
+import phase_probe
+import rollups
+import sketch
+import stub_server
+
+# === CONFIGURATION ===
+DEFAULT_MAX_RECORDS = 10 ** 5
+DEFAULT_MAX_TAIL = 10 ** 4 # Largest MAX_HISTORY_RECORDS tried in the tail sweep
+DEFAULT_TARGETS = 5
+DEFAULT_SPAN_DAYS = 30 # Synthetic checks are spread evenly over this many days up to now
+DEFAULT_REPEAT = 5
+DEFAULT_PROBES = 200
+METRICS_CALLS = 10000 # Simulated checks per metrics overhead run
+REGRESSION_TOLERANCE = 1.25 # --baseline flags results this many times slower
+WRITE_CHUNK_RECORDS = 50000
+INCIDENT_START_PROBABILITY = 0.002
+INCIDENT_MEAN_CHECKS = 6
+SLOW_PROBABILITY = 0.04
+
+# === SYNTHETIC DATA ===
+
+def synthetic_records(count, target_names, span_seconds, end_epoch=None, seed=1):
+    """Yields `count` check records (with 'target') interleaved across targets in timestamp order.
+
+    Most checks are UP with log-normal latencies; a few are SLOW, and targets
+    occasionally fall into incidents: runs of DOWN/ERROR checks.
+    """
+    rng = random.Random(seed)
+    end_epoch = end_epoch if end_epoch is not None else time.time()
+    step = span_seconds / max(1, count)
+    incident_left = dict.fromkeys(target_names, 0)
+    incident_kind = dict.fromkeys(target_names, 'DOWN')
+    for index in range(count):
+        name = target_names[index % len(target_names)]
+        ts_epoch = end_epoch - span_seconds + index * step
+        if incident_left[name] == 0 and rng.random() < INCIDENT_START_PROBABILITY:
+            incident_left[name] = max(1, int(rng.expovariate(1 / INCIDENT_MEAN_CHECKS)))
+            incident_kind[name] = rng.choice(('DOWN', 'DOWN', 'ERROR'))
+        if incident_left[name]:
+            incident_left[name] -= 1
+            status = incident_kind[name]
+            if status == 'DOWN':
+                response_time, extra_info = 0.0, rng.choice(('Request timed out', 'Network error: ConnectionError'))
+            else:
+                response_time, extra_info = round(rng.lognormvariate(-1.0, 0.4), 3), rng.choice(('Status code: 503', 'Status code: 502', 'Keyword missing'))
+        elif rng.random() < SLOW_PROBABILITY:
+            status, response_time, extra_info = 'SLOW', round(rng.uniform(check_status.SLOW_THRESHOLD, check_status.TIMEOUT_SECONDS), 3), None
+        else:
+            status, response_time, extra_info = 'UP', round(min(rng.lognormvariate(-1.1, 0.45), check_status.SLOW_THRESHOLD), 3), None
+        yield {
+            'target': name,
+            'timestamp': datetime.fromtimestamp(ts_epoch, timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'status': status, 'response_time': response_time, 'extra_info': extra_info,
+        }
+
+def write_synthetic_log(directory, count, target_names, span_seconds):
+    """Appends a synthetic log in chunks (bounded memory). Returns the last record of each target."""
+    last_records = {}
+    chunk = []
+    for record in synthetic_records(count, target_names, span_seconds):
+        chunk.append(record)
+        last_records[record['target']] = record
+        if len(chunk) >= WRITE_CHUNK_RECORDS:
+            history_store.append_records(directory, chunk)
+            chunk = []
+    history_store.append_records(directory, chunk)
+    return last_records
+
+def synthetic_state(last_records, rollup_state):
+    """A hot state as the checker would have saved it after the synthetic log."""
+    rng = random.Random(2)
+    targets = {}
+    for name, record in last_records.items():
+        latencies = sketch.new_sketch()
+        for _ in range(1000): sketch.add(latencies, rng.lognormvariate(-1.1, 0.45))
+        targets[name] = check_status.normalize_target_state({
+            'url': f"https://{name}.example.com/", 'status': record['status'], 'response_time': record['response_time'],
+            'extra_info': record['extra_info'], 'stable_count': 12, 'degraded_count': 0, 'alert_mode': False,
+            'last_check_timestamp_utc': record['timestamp'], 'recent_response_times': [0.31, 0.35, 0.33],
+            'latency_sketch': latencies,
+        })
+    last_check = max((r['timestamp'] for r in last_records.values()), default=None)
+    return {'targets': targets, 'rollups': rollup_state, 'last_check_timestamp_utc': last_check}
+
+# === MEASUREMENT ===
+
+def measure(fn, repeat):
+    """Times `fn` `repeat` times, then runs it once more under tracemalloc for its peak allocation."""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'seconds_min': min(timings), 'seconds_median': statistics.median(timings), 'peak_bytes': peak}
+
+def record_result(results, name, result):
+    results[name] = result
+    extra = f"  {result['per_check_overhead_seconds'] * 1e3:8.3f} ms overhead/check" if 'per_check_overhead_seconds' in result else ''
+    print(f"{name:<44} {result['seconds_median'] * 1e3:10.2f} ms  {result['peak_bytes'] / 1e6:9.2f} MB peak{extra}")
+
+def power_sizes(low, high):
+    sizes, size = [], low
+    while size <= high:
+        sizes.append(size)
+        size *= 10
+    return sizes
+
+# === BENCHMARKS ===
+
+def bench_log_size(results, count, target_names, span_seconds, repeat):
+    """Hot paths against a check log of `count` records (dashboard tail at the default size)."""
+    workdir = tempfile.mkdtemp(prefix='snitch-bench-')
+    try:
+        history_dir = os.path.join(workdir, 'history')
+        state_file = os.path.join(workdir, 'status.json')
+        rollups_dir = os.path.join(workdir, 'rollup_data')
+        html_file = os.path.join(workdir, 'index.html')
+        started = time.perf_counter()
+        last_records = write_synthetic_log(history_dir, count, target_names, span_seconds)
+        print(f"-- log of {count} records ({time.perf_counter() - started:.1f}s to generate)")
+        missing_rollups = os.path.join(workdir, 'missing')
+        with contextlib.redirect_stdout(io.StringIO()):
+            rollup_state = check_status.load_rollup_state(missing_rollups, history_dir)
+            check_status.save_current_state(state_file, synthetic_state(last_records, rollup_state), rollups_dir)
+            loaded = check_status.load_previous_state(state_file, history_dir, rollups_dir)
+            check_status.generate_html(html_file, loaded, history_dir) # Publishes the data shards once
+        tag = f"[n={count}]"
+        record_result(results, f"rollups_rebuild{tag}", measure(lambda: check_status.load_rollup_state(missing_rollups, history_dir), max(1, repeat // 2)))
+        record_result(results, f"load_previous_state{tag}", measure(lambda: check_status.load_previous_state(state_file, history_dir, rollups_dir), repeat))
+
+        def save_all_checked():
+            for name in target_names: rollups.mark_dirty(name) # As after a one-shot sweep
+            check_status.save_current_state(state_file, loaded, rollups_dir)
+        record_result(results, f"save_current_state{tag}", measure(save_all_checked, repeat))
+        record_result(results, f"generate_html{tag}", measure(lambda: check_status.generate_html(html_file, loaded, history_dir), repeat))
+        shard_dir = os.path.join(workdir, 'backfill')
+
+        def shards_backfill():
+            shutil.rmtree(shard_dir, ignore_errors=True)
+            data_shards.update_shards(shard_dir, history_dir, target_names)
+        record_result(results, f"data_shards_backfill{tag}", measure(shards_backfill, max(1, repeat // 2)))
+        since = time.time() - 86400
+        record_result(results, f"read_history_24h{tag}", measure(lambda: history_store.read_history(history_dir, since=since), repeat))
+        record_result(results, f"tail_history{tag}", measure(lambda: history_store.tail_history(history_dir, check_status.MAX_HISTORY_RECORDS, target_names), repeat))
+        api.STATE_FILE, api.ROLLUPS_DIR, api.HISTORY_DIR = state_file, rollups_dir, history_dir
+        client = api.app.test_client()
+
+        def api_status_cold():
+            api._file_cache.clear()
+            client.get('/status')
+        record_result(results, f"api_status_cold{tag}", measure(api_status_cold, repeat))
+        record_result(results, f"api_status_cached{tag}", measure(lambda: client.get('/status'), repeat))
+        record_result(results, f"api_history_default{tag}", measure(lambda: client.get('/history'), repeat))
+        if analytics.np is not None:
+            cache_dir = os.path.join(workdir, 'columns')
+
+            def sla_cold():
+                analytics._memory_cache.clear()
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                analytics.sla_report(history_dir, cache_dir=cache_dir)
+
+            def sla_disk_cached():
+                analytics._memory_cache.clear()
+                analytics.sla_report(history_dir, cache_dir=cache_dir)
+            record_result(results, f"sla_report_cold{tag}", measure(sla_cold, max(1, repeat // 2)))
+            record_result(results, f"sla_report_disk_cached{tag}", measure(sla_disk_cached, repeat))
+            record_result(results, f"sla_report_memory_cached{tag}", measure(lambda: analytics.sla_report(history_dir, cache_dir=cache_dir), repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_tail_size(results, tail, target_names, span_seconds, repeat):
+    """Costs that scale with MAX_HISTORY_RECORDS: the per-target tail loaded and rendered each run."""
+    workdir = tempfile.mkdtemp(prefix='snitch-bench-')
+    saved_tail = check_status.MAX_HISTORY_RECORDS
+    try:
+        history_dir = os.path.join(workdir, 'history')
+        state_file = os.path.join(workdir, 'status.json')
+        rollups_dir = os.path.join(workdir, 'rollup_data')
+        html_file = os.path.join(workdir, 'index.html')
+        last_records = write_synthetic_log(history_dir, tail * len(target_names), target_names, span_seconds)
+        print(f"-- MAX_HISTORY_RECORDS={tail}")
+        check_status.MAX_HISTORY_RECORDS = tail
+        with contextlib.redirect_stdout(io.StringIO()):
+            rollup_state = check_status.load_rollup_state(os.path.join(workdir, 'missing'), history_dir)
+            check_status.save_current_state(state_file, synthetic_state(last_records, rollup_state), rollups_dir)
+            loaded = check_status.load_previous_state(state_file, history_dir, rollups_dir)
+            check_status.generate_html(html_file, loaded, history_dir)
+        times = [r['response_time'] for r in loaded['targets'][target_names[0]]['history']]
+        tag = f"[tail={tail}]"
+        record_result(results, f"load_previous_state{tag}", measure(lambda: check_status.load_previous_state(state_file, history_dir, rollups_dir), repeat))
+        record_result(results, f"generate_html{tag}", measure(lambda: check_status.generate_html(html_file, loaded, history_dir), repeat))
+        record_result(results, f"calculate_average_speed{tag}", measure(lambda: check_status.calculate_average_speed(times), repeat))
+    finally:
+        check_status.MAX_HISTORY_RECORDS = saved_tail
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def measure_per_check(fn, probes):
+    """Median/min seconds per call over `probes` calls, and peak memory over a tenth of them."""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn() # Warm up imports and connection pools
+        for _ in range(probes):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            for _ in range(max(1, probes // 10)): fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'seconds_min': min(timings), 'seconds_median': statistics.median(timings), 'peak_bytes': peak}
+
+def bench_probe_overhead(results, probes):
+    """Per-check client overhead of each probe path against the zero-delay local stub server.
+
+    The floor is a bare http.client GET on a kept-alive connection, so the
+    reported overhead is what each probe path adds on top of the HTTP exchange.
+    """
+    server, base_url = stub_server.start_stub_server()
+    url = f"{base_url}/?bytes=20000"
+    floor_conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+
+    def floor_get():
+        floor_conn.request('GET', '/?bytes=20000')
+        floor_conn.getresponse().read()
+    try:
+        floor = measure_per_check(floor_get, probes)
+        record_result(results, 'probe_floor_http_client', floor)
+        base_target = check_status.prepare_target({**check_status.TARGET_DEFAULTS, 'name': 'stub', 'url': url})
+        warm_session = requests.Session()
+        scenarios = {
+            'probe_requests_cold': lambda: check_status.probe_target(base_target),
+            'probe_requests_warm': lambda: check_status.probe_target(base_target, warm_session),
+            'probe_phases': lambda: check_status.probe_target({**base_target, 'probe_mode': 'phases'}),
+        }
+        for name, fn in scenarios.items():
+            result = measure_per_check(fn, probes)
+            result['per_check_overhead_seconds'] = result['seconds_median'] - floor['seconds_median']
+            record_result(results, name, result)
+    finally:
+        floor_conn.close()
+        phase_probe.close_idle_connections()
+        server.shutdown()
+
+def bench_metrics_overhead(results, repeat, calls=METRICS_CALLS):
+    """Per-check instrumentation cost (as apply_check_result and the timed functions pay it), with metrics off and on."""
+    record = {'status': 'UP', 'response_time': 0.42}
+    timed_noop = metrics.timed('snitch_state_save_duration_seconds')(lambda: None)
+
+    def per_check():
+        for _ in range(calls):
+            if metrics.ENABLED: check_status.record_check_metrics('bench', record)
+            timed_noop()
+    saved = metrics.ENABLED
+    try:
+        for enabled in (False, True):
+            metrics.enable(enabled)
+            metrics.reset()
+            result = measure(per_check, repeat)
+            result['per_check_overhead_seconds'] = result['seconds_median'] / calls
+            record_result(results, f"metrics_{'enabled' if enabled else 'disabled'}[calls={calls}]", result)
+    finally:
+        metrics.enable(saved)
+        metrics.reset()
+
+# === RESULTS ===
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """Prints per-benchmark ratios against a previous results file. Returns the names that regressed."""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f).get('results', {})
+    regressions = []
+    print(f"\nCompared with {baseline_path} (regression above {tolerance:.2f}x):")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('seconds_median'):
+            print(f"{name:<44} {'(new)':>10}")
+            continue
+        ratio = result['seconds_median'] / before['seconds_median']
+        memory_ratio = result['peak_bytes'] / before['peak_bytes'] if before.get('peak_bytes') else 1.0
+        flag = ' REGRESSION' if ratio > tolerance else ''
+        if flag: regressions.append(name)
+        print(f"{name:<44} {ratio:9.2f}x time  {memory_ratio:6.2f}x memory{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark Status Snitch's hot paths as history grows.")
+    parser.add_argument('--max-records', type=int, default=DEFAULT_MAX_RECORDS, help='largest check log, in records (up to 10^7)')
+    parser.add_argument('--max-tail', type=int, default=DEFAULT_MAX_TAIL, help='largest MAX_HISTORY_RECORDS to try (0 skips the tail sweep)')
+    parser.add_argument('--targets', type=int, default=DEFAULT_TARGETS, help='synthetic targets the records are spread over')
+    parser.add_argument('--span-days', type=float, default=DEFAULT_SPAN_DAYS, help='time span of the synthetic log')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='timed runs per benchmark')
+    parser.add_argument('--probes', type=int, default=DEFAULT_PROBES, help='checks per probe scenario (0 skips probe benchmarks)')
+    parser.add_argument('--json', help='write machine-readable results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    target_names = [f"target-{index:02d}" for index in range(args.targets)]
+    span_seconds = args.span_days * 86400
+    results = {}
+    for count in power_sizes(100, args.max_records):
+        bench_log_size(results, count, target_names, span_seconds, args.repeat)
+    for tail in power_sizes(100, args.max_tail):
+        bench_tail_size(results, tail, target_names, span_seconds, args.repeat)
+    print("-- metrics overhead")
+    bench_metrics_overhead(results, args.repeat)
+    if args.probes:
+        print("-- probe overhead")
+        bench_probe_overhead(results, args.probes)
+
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"Wrote results to {args.json}")
+    if args.baseline and compare_to_baseline(results, args.baseline, args.tolerance):
+        sys.exit(1)
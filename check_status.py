@@ -1,74 +1,261 @@
 # SimplePractice Status Snitch - GitHub Action Version (with History & EST/EDT)
 # Stores history, calculates Avg Speed, updates UI with Eastern Time display.
+# Probes every target in the registry concurrently, one keyed state record per target.
+# Check records go to an append-only log (history_store); status.json only holds hot counters.
+# Uptime and latency windows come from incrementally maintained rollups (one file per target in rollup_data/).
+# Latency percentiles come from mergeable sketches kept per target and per rollup bucket.
+# Targets in 'phases' probe mode record DNS/connect/TLS/TTFB/body timings per check.
+# `--daemon` keeps running with warm connection pools and a per-target scheduler.
+# `--worker`/`--aggregate` split probing across locations and merge by quorum (fleet.py).
 
 import requests
+import urllib3
+import argparse
+import heapq
+import http.client
+import random
+import signal
 import time
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlparse
 import json
 import os
 import html
+import threading
 import pytz  # Import pytz for timezone handling
+import history_store
+import rollups
+import sketch
+import phase_probe
+import alerts
+import data_shards
+import anomaly
+import validation
+import metrics
+import fleet
 
 # === CONFIGURATION ===
 URL = "https://account.simplepractice.com/"
 TIMEOUT_SECONDS = 15
 SLOW_THRESHOLD = 2.0
-STATE_FILE = "status.json"
+STATE_FILE = "status.json" # Hot state: counters and recent times per target, no history
+HISTORY_DIR = history_store.HISTORY_DIR # Append-only check log segments
+ROLLUPS_DIR = rollups.ROLLUPS_DIR # Minute/hour/day/week buckets, one file per target
 OUTPUT_HTML_FILE = "index.html"
+TARGETS_FILE = os.getenv('TARGETS_FILE', 'targets.json')
 CHECK_INTERVAL_MINUTES = 5
 MAX_RESPONSE_TIMES_TO_KEEP = 3
-MAX_HISTORY_RECORDS = 50
+MAX_HISTORY_RECORDS = 50 # Tail of the check log loaded for the dashboard table
+MAX_WORKERS = 32 # Upper bound on concurrent probes per sweep
+MAX_CONNECTIONS_PER_HOST = 4 # Concurrent probes allowed against a single host
+PROBE_MODE = os.getenv('PROBE_MODE', 'requests') # 'phases' times DNS/connect/TLS/TTFB/body separately
+DAEMON_INTERVAL_SECONDS = int(os.getenv('DAEMON_INTERVAL_SECONDS', 60)) # Default per-target cadence in --daemon mode
+MIN_INTERVAL_SECONDS = 10 # Fastest cadence a target may ask for
+SCHEDULE_JITTER = 0.1 # Each run fires within +/-10% of its interval around the anchored schedule
+FLUSH_INTERVAL_SECONDS = int(os.getenv('FLUSH_INTERVAL_SECONDS', 60)) # How often the daemon writes state and HTML
+AGGREGATE_INTERVAL_SECONDS = int(os.getenv('AGGREGATE_INTERVAL_SECONDS', 5)) # How often the fleet aggregator reads the spools
 TARGET_TIMEZONE = 'America/New_York' # Timezone for display
 EXPECTED_KEYWORD = os.getenv('EXPECTED_KEYWORD')
 SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
+ALERT_OUTBOX_FILE = alerts.ALERT_OUTBOX_FILE # Undelivered alerts survive restarts here
+ALERT_FLUSH_TIMEOUT_SECONDS = 10 # Longest a run waits on Slack before leaving alerts for the next run
+STREAM_URL = os.getenv('STREAM_URL') # api.py /stream endpoint; when set the page updates live
+
+# === TARGET DEFAULTS (overridable per target in TARGETS_FILE) ===
+TARGET_DEFAULTS = {
+    'timeout': TIMEOUT_SECONDS,
+    'slow_threshold': SLOW_THRESHOLD,
+    'expected_keyword': EXPECTED_KEYWORD,
+    'assertions': [], # Streaming body checks, see validation.py
+    'max_read_bytes': validation.MAX_READ_BYTES,
+    'probe_mode': PROBE_MODE,
+    'verify_tls': True, # False, or a CA bundle path for self-signed stand-ins
+    'interval': DAEMON_INTERVAL_SECONDS, # Seconds between checks in --daemon mode
+}
 
 # === STATUS INFO (for display) ===
 STATUS_INFO = {
     "UP": {"emoji": "✅", "text": "All Good!", "card_bg_class": "bg-green-100", "text_color": "text-green-700", "history_class": "text-green-600"},
     "SLOW": {"emoji": "🐢", "text": "A Bit Slow...", "card_bg_class": "bg-yellow-100", "text_color": "text-yellow-700", "history_class": "text-yellow-600"},
+    "DEGRADED": {"emoji": "📉", "text": "Slower Than Usual", "card_bg_class": "bg-yellow-100", "text_color": "text-yellow-700", "history_class": "text-yellow-600"},
     "ERROR": {"emoji": "⚠️", "text": "Uh Oh! Error!", "card_bg_class": "bg-orange-100", "text_color": "text-orange-700", "history_class": "text-orange-600"},
     "DOWN": {"emoji": "💔", "text": "It's Down!", "card_bg_class": "bg-red-100", "text_color": "text-red-700", "history_class": "text-red-600"},
     "UNKNOWN": {"emoji": "❓", "text": "Unknown", "card_bg_class": "bg-gray-100", "text_color": "text-gray-700", "history_class": "text-gray-500"},
 }
 
+PHASE_COLORS = {
+    'dns': 'rgb(129, 140, 248)', 'connect': 'rgb(96, 165, 250)', 'tls': 'rgb(52, 211, 153)',
+    'ttfb': 'rgb(251, 191, 36)', 'body': 'rgb(244, 114, 182)',
+}
+
 # === HELPER FUNCTIONS ===
 
-def load_previous_state(filename):
-    """Loads state including history and recent response times."""
-    default_state = {
-        'status': 'UNKNOWN', 'stable_count': 0, 'degraded_count': 0, 'alert_mode': False,
+def target_name_for_url(url):
+    """Derives a registry name for a URL (its host, plus path when not the root)."""
+    parsed = urlparse(url)
+    path = parsed.path.rstrip('/')
+    return f"{parsed.netloc}{path}" if path else parsed.netloc
+
+
+DEFAULT_TARGET_NAME = target_name_for_url(URL)
+
+
+def prepare_target(target):
+    """Compiles a target's assertions (expected_keyword first) into target['validation']. Raises ValueError."""
+    target['validation'] = validation.compile_assertions(target.get('assertions'), target.get('expected_keyword'))
+    if target.get('verify_tls') is False: urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning) # Opted out; one warning per check would drown the log
+    return target
+
+def load_targets(filename):
+    """Loads the target registry, falling back to the single configured URL."""
+    default_target = prepare_target({**TARGET_DEFAULTS, 'name': DEFAULT_TARGET_NAME, 'url': URL})
+    if not os.path.exists(filename):
+        return [default_target]
+    try:
+        with open(filename, 'r') as f:
+            config = json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Target registry '{filename}' invalid, using default target. Error: {e}")
+        return [default_target]
+    if isinstance(config, list): config = {'targets': config}
+    defaults = {**TARGET_DEFAULTS, **config.get('defaults', {})}
+    targets = []
+    seen_names = set()
+    for entry in config.get('targets', []):
+        if not isinstance(entry, dict) or not entry.get('url'):
+            print(f"Skipping invalid target entry: {entry!r}")
+            continue
+        target = {**defaults, **entry}
+        target['name'] = str(target.get('name') or target_name_for_url(target['url']))
+        if target['name'] in seen_names:
+            print(f"Skipping duplicate target name '{target['name']}'")
+            continue
+        try:
+            prepare_target(target)
+        except ValueError as e:
+            print(f"Skipping target '{target['name']}' with an invalid assertion: {e}")
+            continue
+        seen_names.add(target['name'])
+        targets.append(target)
+    if not targets:
+        print(f"Target registry '{filename}' has no valid targets, using default target.")
+        return [default_target]
+    print(f"Loaded {len(targets)} target(s) from {filename}")
+    return targets
+
+def default_target_state():
+    """Returns the state record for a target that has never been checked."""
+    return {
+        'url': None, 'status': 'UNKNOWN', 'stable_count': 0, 'degraded_count': 0, 'alert_mode': False,
         'last_check_timestamp_utc': None, 'response_time': 0, 'extra_info': '',
-        'recent_response_times': [], 'history': []
+        'recent_response_times': [], 'latency_sketch': sketch.new_sketch(),
+        'connection_sketches': {'cold': sketch.new_sketch(), 'warm': sketch.new_sketch()},
+        'anomaly': anomaly.new_detector(), 'content_hash': None, 'history': []
     }
+
+def normalize_target_state(target_state):
+    """Fills in missing keys and trims the per-target lists to their caps."""
+    if not isinstance(target_state, dict): target_state = {}
+    for key, default_value in default_target_state().items(): target_state.setdefault(key, default_value)
+    if not isinstance(target_state.get('recent_response_times'), list): target_state['recent_response_times'] = []
+    target_state['recent_response_times'] = target_state['recent_response_times'][-MAX_RESPONSE_TIMES_TO_KEEP:]
+    if not isinstance(target_state.get('latency_sketch'), dict): target_state['latency_sketch'] = sketch.new_sketch()
+    if not isinstance(target_state.get('connection_sketches'), dict): target_state['connection_sketches'] = {}
+    for kind in ('cold', 'warm'): target_state['connection_sketches'].setdefault(kind, sketch.new_sketch())
+    if not isinstance(target_state.get('anomaly'), dict): target_state['anomaly'] = anomaly.new_detector()
+    if not isinstance(target_state.get('history'), list): target_state['history'] = []
+    target_state['history'] = target_state['history'][-MAX_HISTORY_RECORDS:]
+    return target_state
+
+def latency_for_rollup(check_record, timeout=TIMEOUT_SECONDS):
+    """Load time that counts toward averages, or None for zeros and checks at the target's `timeout`."""
+    rt = check_record.get('response_time', 0)
+    return float(rt) if isinstance(rt, (int, float)) and 0 < rt < timeout else None
+
+def target_timeouts(targets):
+    return {t['name']: t['timeout'] for t in targets}
+
+def rollup_check(rollup_state, name, check_record, timeout=TIMEOUT_SECONDS):
+    """Folds one check record into the target's rollup tiers."""
+    ts_epoch = history_store.parse_timestamp(check_record['timestamp'])
+    rollups.record_check(rollup_state.setdefault(name, {}), ts_epoch, check_record.get('status', 'UNKNOWN'), latency_for_rollup(check_record, timeout))
+    rollups.mark_dirty(name)
+
+def load_rollup_state(rollups_dir, history_dir, timeouts=None):
+    """Loads rollups, rebuilding them from the check log when there are none yet (`timeouts`: target name -> timeout)."""
+    rollup_state = rollups.load_rollups(rollups_dir)
+    if rollup_state is None:
+        rollup_state = {}
+        records = history_store.read_history(history_dir)
+        for record in records:
+            if record.get('target') and record.get('timestamp'):
+                rollup_check(rollup_state, record['target'], record, (timeouts or {}).get(record['target'], TIMEOUT_SECONDS))
+        print(f"Rebuilt rollups from {len(records)} logged check(s)")
+    return rollup_state
+
+@metrics.timed('snitch_state_load_duration_seconds')
+def load_previous_state(filename, history_dir=HISTORY_DIR, rollups_dir=ROLLUPS_DIR, timeouts=None):
+    """Loads the hot per-target state plus the tail of each target's check log and its rollups.
+
+    Older layouts (a single top-level record, or history embedded in the state
+    file) are migrated: embedded history is moved into the check log once.
+    """
+    default_state = {'targets': {}, 'last_check_timestamp_utc': None, 'rollups': {}}
     try:
         if not os.path.exists(filename):
             print(f"State file '{filename}' not found, starting fresh.")
+            default_state['rollups'] = load_rollup_state(rollups_dir, history_dir, timeouts)
             return default_state
         with open(filename, 'r') as f:
             state = json.load(f)
-            for key, default_value in default_state.items(): state.setdefault(key, default_value)
-            if not isinstance(state.get('recent_response_times'), list): state['recent_response_times'] = []
-            state['recent_response_times'] = state['recent_response_times'][-MAX_RESPONSE_TIMES_TO_KEEP:]
-            if not isinstance(state.get('history'), list): state['history'] = []
-            state['history'] = state['history'][-MAX_HISTORY_RECORDS:]
-            print(f"Loaded previous state (History items: {len(state['history'])})")
-            return state
+        if not isinstance(state, dict): raise TypeError("state is not an object")
+        if 'targets' not in state:
+            # Pre-registry layout: one top-level record for the default URL
+            legacy = {k: v for k, v in state.items() if k in default_target_state()}
+            legacy.setdefault('url', URL)
+            state = {'targets': {DEFAULT_TARGET_NAME: legacy}, 'last_check_timestamp_utc': state.get('last_check_timestamp_utc')}
+        if not isinstance(state.get('targets'), dict): state['targets'] = {}
+        state.setdefault('last_check_timestamp_utc', None)
+        embedded = []
+        for name, target_state in state['targets'].items():
+            if isinstance(target_state, dict) and isinstance(target_state.get('history'), list):
+                embedded.extend({'target': name, **check} for check in target_state['history'] if isinstance(check, dict) and check.get('timestamp'))
+        if embedded:
+            print(f"Migrating {len(embedded)} embedded history record(s) into {history_dir}/")
+            history_store.append_records(history_dir, embedded)
+        tails = history_store.tail_history(history_dir, MAX_HISTORY_RECORDS, targets=list(state['targets']))
+        for name in list(state['targets']):
+            target_state = state['targets'][name] if isinstance(state['targets'][name], dict) else {}
+            target_state['history'] = [{k: v for k, v in r.items() if k != 'target'} for r in tails.get(name, [])]
+            state['targets'][name] = normalize_target_state(target_state)
+        state['rollups'] = load_rollup_state(rollups_dir, history_dir, timeouts)
+        history_items = sum(len(t['history']) for t in state['targets'].values())
+        print(f"Loaded previous state (Targets: {len(state['targets'])}, History items: {history_items})")
+        return state
     except (FileNotFoundError, json.JSONDecodeError, TypeError) as e:
         print(f"State file '{filename}' not found or invalid, starting fresh. Error: {e}")
+        default_state['rollups'] = load_rollup_state(rollups_dir, history_dir, timeouts)
         return default_state
 
-def save_current_state(filename, state_data):
-    """Saves the current state (including history) to the state file."""
+@metrics.timed('snitch_state_save_duration_seconds')
+def save_current_state(filename, state_data, rollups_dir=ROLLUPS_DIR):
+    """Atomically saves the hot per-target state and changed rollups; history lives in the check log and is not rewritten."""
     try:
-        times = state_data.get('recent_response_times', [])
-        if not isinstance(times, list): times = []
-        state_data['recent_response_times'] = times[-MAX_RESPONSE_TIMES_TO_KEEP:]
-        history = state_data.get('history', [])
-        if not isinstance(history, list): history = []
-        state_data['history'] = history[-MAX_HISTORY_RECORDS:]
-        with open(filename, 'w') as f:
-            json.dump(state_data, f, indent=2)
-        print(f"Saved current state to {filename} (History items: {len(state_data['history'])})")
+        targets = state_data.get('targets', {})
+        if not isinstance(targets, dict): targets = {}
+        for name in list(targets):
+            targets[name] = normalize_target_state(targets[name])
+        state_data['targets'] = targets
+        hot_state = {k: v for k, v in state_data.items() if k != 'rollups'}
+        hot_state['targets'] = {name: {k: v for k, v in t.items() if k != 'history'} for name, t in targets.items()}
+        if 'rollups' in state_data: rollups.save_rollups(rollups_dir, state_data['rollups'])
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(hot_state, f, indent=2)
+        os.replace(filename + '.tmp', filename)
+        print(f"Saved current state to {filename} (Targets: {len(targets)})")
     except IOError as e:
         print(f"Error saving state file '{filename}': {e}")
 
@@ -85,62 +272,77 @@ def calculate_average_speed(times_list):
     return sum(valid_times) / len(valid_times), len(valid_times)
 
 def send_slack_notification(message):
-    """Send a message to Slack if webhook URL configured."""
+    """Send a message to Slack if webhook URL configured. Returns True once Slack has accepted it."""
     if not SLACK_WEBHOOK_URL or not message:
-        return
+        return False
     try:
         resp = requests.post(SLACK_WEBHOOK_URL, json={"text": message}, timeout=5)
         if resp.status_code != 200:
             print(f"Slack notification failed: {resp.status_code}")
+            return False
+        return True
     except Exception as e:
         print(f"Slack notification error: {e}")
+        return False
 
-def generate_html(filename, state_data):
-    """Generates the index.html file with current status and history table."""
+def queue_notifications(notifications_by_target):
+    """Hands notifications to the background alert worker (never blocks on Slack)."""
+    if not SLACK_WEBHOOK_URL: return
+    alerts.enqueue_alerts([{'target': name, **n} for name, notifications in notifications_by_target.items() for n in notifications])
 
-    # --- Get Timezone Object ---
-    try:
-        eastern_tz = pytz.timezone(TARGET_TIMEZONE)
-    except pytz.UnknownTimeZoneError:
-        print(f"Error: Unknown timezone '{TARGET_TIMEZONE}'. Defaulting to UTC.")
-        eastern_tz = timezone.utc # Fallback to UTC
+@lru_cache(maxsize=8192)
+def format_local_timestamp(ts_str, tz, fmt):
+    """Converts a stored UTC ISO timestamp to a formatted string in the display timezone (memoized)."""
+    dt_utc = datetime.fromisoformat(ts_str.replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
+    return dt_utc.astimezone(tz).strftime(fmt)
 
+def render_target_section(name, target_state, eastern_tz, chart_id, target_rollups=None, now_epoch=None):
+    """Renders the status card, history table and charts for one target.
+
+    Uptime windows and weekly averages are read from the target's rollups.
+    The table holds the loaded tail of the check log; charts and older rows
+    are filled in by the page from the target's data shards.
+    """
     # --- Get Latest Status Data ---
-    history = state_data.get('history', [])
+    history = target_state.get('history', [])
     latest_check_data = history[-1] if history else {}
     status = latest_check_data.get('status', 'UNKNOWN')
     info = STATUS_INFO.get(status, STATUS_INFO["UNKNOWN"])
     response_time = latest_check_data.get('response_time', 0)
     response_time_str = f"{response_time:.2f} s" if status != 'UNKNOWN' and isinstance(response_time, (int, float)) and response_time >= 0 else "-- s"
 
-    uptime_percent = 0.0
-    if history:
-        up_count = sum(1 for h in history if h.get('status') in ['UP', 'SLOW'])
-        uptime_percent = (up_count / len(history)) * 100
+    # --- Uptime Windows (from rollups, constant time regardless of retention) ---
+    target_rollups = target_rollups or {}
+    now_epoch = now_epoch if now_epoch is not None else time.time()
+    windows = {label: rollups.query_window(target_rollups, seconds, now_epoch) for label, seconds in rollups.WINDOWS.items()}
+    uptime_strs = {label: f"{w['uptime_percent']:.2f}%" if w['uptime_percent'] is not None else "--" for label, w in windows.items()}
+    percentile_strs = {label: f"{windows['24h'][label]:.2f} s" if windows['24h'][label] is not None else "-- s" for label in sketch.PERCENTILES}
+    connection_sketches = target_state.get('connection_sketches') or {}
+    connection_p50s = {kind: sketch.quantile(connection_sketches.get(kind), 0.5) for kind in ('cold', 'warm')}
+    connection_html = (
+        f'<div class="text-xs text-center text-gray-600 mt-1">Median load time, cold connection: <span class="font-semibold">{connection_p50s["cold"]:.2f} s</span> &middot; warm (reused): <span class="font-semibold">{connection_p50s["warm"]:.2f} s</span></div>'
+        if None not in connection_p50s.values() else ''
+    )
 
     # --- Calculate Average Speed ---
-    recent_times = state_data.get('recent_response_times', [])
+    recent_times = target_state.get('recent_response_times', [])
     average_speed, valid_avg_count = calculate_average_speed(recent_times)
     average_speed_str = f"{average_speed:.2f} s" if average_speed > 0 else "-- s"
 
     # --- Prepare Timestamp (Convert to Eastern Time) ---
-    last_check_utc_str = latest_check_data.get('timestamp', state_data.get('last_check_timestamp_utc'))
+    last_check_utc_str = latest_check_data.get('timestamp', target_state.get('last_check_timestamp_utc'))
     last_check_local_str = "Never"
     if last_check_utc_str:
         try:
-            # Parse ISO string, make it UTC aware
-            last_check_dt_utc = datetime.fromisoformat(last_check_utc_str.replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
-            # Convert to target timezone
-            last_check_dt_local = last_check_dt_utc.astimezone(eastern_tz)
             # Format timestamp nicely (e.g., "Apr 03, 2025, 11:26:15 AM EDT")
             # %Z should correctly show EST or EDT based on the date and pytz data
-            last_check_local_str = last_check_dt_local.strftime('%b %d, %Y, %I:%M:%S %p %Z')
+            last_check_local_str = format_local_timestamp(last_check_utc_str, eastern_tz, '%b %d, %Y, %I:%M:%S %p %Z')
         except (ValueError, TypeError) as e:
             print(f"Error formatting main timestamp: {e}")
             last_check_local_str = "Invalid date"
 
-    # --- Generate History Table Rows (Convert to Eastern Time) ---
-    history_rows_html = ""
+    # --- Generate History Table Rows (one pass, newest first; each timestamp parsed once) ---
+    history_rows = []
     for check in reversed(history):
         hist_status = check.get('status', 'UNKNOWN')
         hist_info = STATUS_INFO.get(hist_status, STATUS_INFO["UNKNOWN"])
@@ -155,17 +357,13 @@ def generate_html(filename, state_data):
         hist_local_str_short = "N/A"
         if hist_ts_str:
             try:
-                # Parse ISO string, make it UTC aware
-                hist_dt_utc = datetime.fromisoformat(hist_ts_str.replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
-                # Convert to target timezone
-                hist_dt_local = hist_dt_utc.astimezone(eastern_tz)
                 # Shorter format for history table (e.g., "Apr 03, 11:26:15 AM EDT")
-                hist_local_str_short = hist_dt_local.strftime('%b %d, %I:%M:%S %p %Z')
+                hist_local_str_short = format_local_timestamp(hist_ts_str, eastern_tz, '%b %d, %I:%M:%S %p %Z')
             except (ValueError, TypeError) as e:
                 print(f"Error formatting history timestamp: {e}")
                 hist_local_str_short = "Invalid Date"
 
-        history_rows_html += f"""
+        history_rows.append(f"""
         <tr>
             <td class="whitespace-nowrap px-3 py-2 text-sm text-gray-500">{html.escape(hist_local_str_short)}</td>
             <td class="whitespace-nowrap px-3 py-2 text-sm font-medium {hist_info['history_class']}">
@@ -173,50 +371,239 @@ def generate_html(filename, state_data):
             </td>
             <td class="whitespace-nowrap px-3 py-2 text-sm text-gray-500">{html.escape(hist_resp_time_str)}</td>
             <td class="px-3 py-2 text-sm text-gray-500">{html.escape(hist_extra or '')}</td>
-        </tr>"""
-
-    # --- Prepare Data for Graph and Weekly Averages ---
-    graph_labels = []
-    graph_times = []
-    week_sums = {}
-    week_counts = {}
-    for check in sorted(history, key=lambda c: c.get('timestamp', '')):
-        ts = check.get('timestamp')
-        rt = check.get('response_time', 0)
-        label = ""
-        if ts:
-            try:
-                dt_local = (
-                    datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                    .replace(tzinfo=timezone.utc)
-                    .astimezone(eastern_tz)
-                )
-                label = dt_local.strftime('%m/%d %H:%M')
-                year, week_num, _ = dt_local.isocalendar()
-                week_key = f"{year}-W{week_num:02d}"
-                if isinstance(rt, (int, float)) and 0 < rt < TIMEOUT_SECONDS:
-                    week_sums.setdefault(week_key, 0.0)
-                    week_counts.setdefault(week_key, 0)
-                    week_sums[week_key] += float(rt)
-                    week_counts[week_key] += 1
-            except Exception as e:
-                print(f"Error preparing graph data: {e}")
-                label = ts
-        graph_labels.append(label)
-        graph_times.append(float(rt) if isinstance(rt, (int, float)) else 0.0)
-
-    weekly_rows_html = ""
-    for wk in sorted(week_sums):
-        count = week_counts.get(wk, 0)
-        if count:
-            avg = week_sums[wk] / count
-            weekly_rows_html += (
-                f"<tr><td class='px-3 py-2 text-sm text-gray-500'>{wk}</td>"
-                f"<td class='px-3 py-2 text-sm text-gray-500'>{avg:.2f} s</td></tr>"
+        </tr>""")
+    history_rows_html = ''.join(history_rows)
+    oldest_shown = history[0].get('timestamp', '') if history else ''
+
+    # --- Weekly Averages (week tier buckets, Monday 00:00 UTC) ---
+    weekly_rows = []
+    for start, bucket in sorted(target_rollups.get('week', {}).items(), key=lambda item: int(item[0])):
+        summary = rollups.summarize(bucket)
+        if summary['avg_latency'] is not None:
+            year, week_num, _ = datetime.fromtimestamp(int(start), timezone.utc).isocalendar()
+            weekly_rows.append(
+                f"<tr><td class='px-3 py-2 text-sm text-gray-500'>{year}-W{week_num:02d}</td>"
+                f"<td class='px-3 py-2 text-sm text-gray-500'>{summary['avg_latency']:.2f} s</td>"
+                f"<td class='px-3 py-2 text-sm text-gray-500'>{summary['uptime_percent']:.2f}%</td></tr>"
             )
+    weekly_rows_html = ''.join(weekly_rows)
+
+    section_html = f"""
+        <section id="target-{html.escape(chart_id)}" class="mb-10">
+        <h2 class="text-2xl font-bold text-gray-800 mb-1">{html.escape(name)}</h2>
+        <p class="text-xs text-gray-500 mb-3"><code class="bg-white/70 px-1 rounded font-mono">{html.escape(target_state.get('url') or '')}</code></p>
+
+        <div class="rounded-lg p-6 mb-8 shadow-lg transition transform duration-500 {info['card_bg_class']} {'animate-pulse-bg' if status in ['SLOW', 'DEGRADED', 'ERROR', 'DOWN'] else ''}">
+            <div class="flex items-center justify-between mb-4 flex-wrap">
+                <h3 class="text-xl font-medium flex items-center {info['text_color']} mb-2 sm:mb-0">
+                    <span id="live-emoji-{html.escape(chart_id)}" class="status-emoji">{info['emoji']}</span>
+                    <span>Current Status:</span> <span id="live-text-{html.escape(chart_id)}" class="ml-2 font-semibold">{html.escape(info['text'])}</span>
+                </h3>
+                <span class="text-xs text-gray-500 w-full text-right sm:w-auto">
+                    Checked: <span id="live-checked-{html.escape(chart_id)}">{html.escape(last_check_local_str)}</span>
+                </span>
+            </div>
+            <div class="grid grid-cols-1 sm:grid-cols-3 gap-4 text-sm">
+                <div class="bg-white/60 rounded-lg p-3 text-center shadow-sm">
+                    <span class="text-gray-600 block text-xs mb-1">Load Speed (Last)</span>
+                    <span id="live-time-{html.escape(chart_id)}" class="font-semibold text-lg text-gray-800">{html.escape(response_time_str)}</span>
+                </div>
+                <div class="bg-white/60 rounded-lg p-3 text-center shadow-sm">
+                    {f'<span class="text-gray-600 block text-xs mb-1">Avg. Speed (Last {valid_avg_count})</span>' if valid_avg_count > 0 else '<span class="text-gray-600 block text-xs mb-1">Avg. Speed</span>'}
+                    <span class="font-semibold text-lg text-gray-800">{html.escape(average_speed_str)}</span>
+                </div>
+                <div class="bg-white/60 rounded-lg p-3 text-center shadow-sm">
+                    <span class="text-gray-600 block text-xs mb-1">Uptime (24h)</span>
+                    <span class="font-semibold text-lg text-gray-800">{uptime_strs['24h']}</span>
+                </div>
+            </div>
+            <div class="text-xs text-center text-gray-600 mt-3">
+                Uptime 7d: <span class="font-semibold">{uptime_strs['7d']}</span> &middot;
+                30d: <span class="font-semibold">{uptime_strs['30d']}</span> &middot;
+                90d: <span class="font-semibold">{uptime_strs['90d']}</span>
+            </div>
+            <div class="text-xs text-center text-gray-600 mt-1">
+                Load time 24h p50: <span class="font-semibold">{percentile_strs['p50']}</span> &middot;
+                p95: <span class="font-semibold">{percentile_strs['p95']}</span> &middot;
+                p99: <span class="font-semibold">{percentile_strs['p99']}</span>
+            </div>
+            {connection_html}
+             {f'<div class="text-xs text-center mt-3 {info["text_color"]}"><p>({html.escape(latest_check_data.get("extra_info") or "")})</p></div>' if status in ["ERROR", "DOWN"] and latest_check_data.get("extra_info") else ''}
+        </div>
+
+        <div class="mb-6">
+            <h3 class="text-xl font-semibold text-gray-700 mb-3">Recent History (Last {len(history)} Checks)</h3>
+            {f'<div class="overflow-x-auto rounded-lg border border-gray-200 max-h-96 overflow-y-auto"><table class="min-w-full divide-y divide-gray-200 history-table"><thead><tr><th class="whitespace-nowrap">Timestamp ({TARGET_TIMEZONE})</th><th class="whitespace-nowrap">Status</th><th class="whitespace-nowrap">Load Time</th><th class="whitespace-nowrap">Details</th></tr></thead><tbody id="history-body-{html.escape(chart_id)}" data-oldest="{html.escape(oldest_shown)}" class="bg-white divide-y divide-gray-200">{history_rows_html}</tbody></table></div>' if history else '<p class="text-gray-500">No historical data available yet.</p>'}
+            <button id="load-older-{html.escape(chart_id)}" type="button" class="mt-3 text-sm text-indigo-600 hover:underline" hidden>Load older history</button>
+        </div>
+
+        <div class="mb-6">
+            <h3 class="text-xl font-semibold text-gray-700 mb-3">Response Time Trend</h3>
+            <canvas id="history-chart-{html.escape(chart_id)}" class="w-full" height="120"></canvas>
+        </div>
+        <div id="phase-wrap-{html.escape(chart_id)}" class="mb-6" hidden><h3 class="text-xl font-semibold text-gray-700 mb-3">Request Phase Breakdown</h3><canvas id="phase-chart-{html.escape(chart_id)}" class="w-full" height="120"></canvas></div>
+
+        <div class="mb-6">
+            <h3 class="text-xl font-semibold text-gray-700 mb-3">Weekly Averages</h3>
+            {f'<div class="overflow-x-auto rounded-lg border border-gray-200"><table class="min-w-full divide-y divide-gray-200 history-table"><thead><tr><th>Week (UTC)</th><th>Avg. Load Time</th><th>Uptime</th></tr></thead><tbody>{weekly_rows_html}</tbody></table></div>' if weekly_rows_html else '<p class="text-gray-500">Not enough data for weekly averages.</p>'}
+        </div>
+        </section>"""
+    return section_html
+
+def render_live_script(live_ids):
+    """Script that subscribes to STREAM_URL and patches each target's card and overview row per check."""
+    status_info = {status: {'emoji': i['emoji'], 'text': i['text']} for status, i in STATUS_INFO.items()}
+    return f"""<script>
+        const liveIds = {json.dumps(live_ids)};
+        const statusInfo = {json.dumps(status_info)};
+        const setText = (id, text) => {{ const el = document.getElementById(id); if (el) el.textContent = text; }};
+        const source = new EventSource({json.dumps(STREAM_URL)});
+        source.addEventListener('check', e => {{
+            const check = JSON.parse(e.data);
+            const id = liveIds[check.target];
+            if (id === undefined) return;
+            const info = statusInfo[check.status] || statusInfo.UNKNOWN;
+            const seconds = check.status === 'UNKNOWN' ? '-- s' : `${{Number(check.response_time).toFixed(2)}} s`;
+            setText(`live-emoji-${{id}}`, info.emoji);
+            setText(`live-text-${{id}}`, info.text);
+            setText(`live-time-${{id}}`, seconds);
+            setText(`live-checked-${{id}}`, new Date(check.timestamp).toLocaleString('en-US', {{ timeZone: {json.dumps(TARGET_TIMEZONE)}, dateStyle: 'medium', timeStyle: 'medium' }}));
+            setText(`live-overview-status-${{id}}`, `${{info.emoji}} ${{check.status}}`);
+            setText(`live-overview-time-${{id}}`, seconds);
+        }});
+        source.addEventListener('reset', () => location.reload()); // Missed more checks than the stream could replay
+    </script>"""
+
+def render_shard_script(shard_targets):
+    """Script that draws each target's charts from its newest data shards and pages older days on demand."""
+    status_info = {status: {'emoji': i['emoji'], 'cls': i['history_class']} for status, i in STATUS_INFO.items()}
+    return f"""<script>
+    (() => {{
+        const shardTargets = {json.dumps(shard_targets)};
+        const statusInfo = {json.dumps(status_info)};
+        const phases = {json.dumps(list(phase_probe.PHASES))};
+        const phaseColors = {json.dumps(PHASE_COLORS)};
+        const recentChecks = {MAX_HISTORY_RECORDS};
+        const timeZone = {json.dumps(TARGET_TIMEZONE)};
+        const labelFormat = new Intl.DateTimeFormat('en-US', {{ timeZone, month: '2-digit', day: '2-digit', hour: '2-digit', minute: '2-digit', hourCycle: 'h23' }});
+        const rowFormat = new Intl.DateTimeFormat('en-US', {{ timeZone, month: 'short', day: '2-digit', hour: '2-digit', minute: '2-digit', second: '2-digit', timeZoneName: 'short' }});
+        const escapeHtml = s => String(s ?? '').replace(/[&<>"']/g, c => ({{ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }})[c]);
+        const seconds = (status, rt) => status === 'UNKNOWN' || !(rt >= 0) ? '-- s' : `${{Number(rt).toFixed(2)}} s`;
+
+        function draw(view, id) {{
+            const labels = view.rows.map(r => r.label);
+            const data = {{ labels, datasets: [{{ label: 'Load Time (s)', data: view.rows.map(r => r.rt), borderColor: 'rgb(34, 197, 94)', tension: 0.1, fill: false }}] }};
+            if (view.chart) {{ view.chart.data = data; view.chart.update(); }}
+            else view.chart = new Chart(document.getElementById(`history-chart-${{id}}`), {{ type: 'line', data, options: {{ scales: {{ y: {{ beginAtZero: true }} }}, plugins: {{ legend: {{ display: false }} }} }} }});
+            const phased = view.rows.filter(r => r.phases);
+            if (!phased.length) return;
+            document.getElementById(`phase-wrap-${{id}}`).hidden = false;
+            const phaseData = {{ labels: phased.map(r => r.label), datasets: phases.map(p => ({{ label: p.toUpperCase(), data: phased.map(r => r.phases[p] || 0), backgroundColor: phaseColors[p] }})) }};
+            if (view.phaseChart) {{ view.phaseChart.data = phaseData; view.phaseChart.update(); }}
+            else view.phaseChart = new Chart(document.getElementById(`phase-chart-${{id}}`), {{ type: 'bar', data: phaseData, options: {{ scales: {{ x: {{ stacked: true }}, y: {{ stacked: true, beginAtZero: true }} }} }} }});
+        }}
+
+        function appendOlderRows(tbody, rows) {{
+            // The page ships the newest checks; loaded rows older than those are appended when paging
+            if (!tbody) return;
+            let oldest = tbody.dataset.oldest ? Date.parse(tbody.dataset.oldest) : Infinity;
+            const html = [];
+            for (let i = rows.length - 1; i >= 0; i--) {{
+                const r = rows[i];
+                if (!(r.epoch < oldest)) continue;
+                const info = statusInfo[r.status] || statusInfo.UNKNOWN;
+                html.push(`<tr><td class="whitespace-nowrap px-3 py-2 text-sm text-gray-500">${{escapeHtml(rowFormat.format(r.epoch))}}</td><td class="whitespace-nowrap px-3 py-2 text-sm font-medium ${{info.cls}}">${{info.emoji}} ${{escapeHtml(r.status)}}</td><td class="whitespace-nowrap px-3 py-2 text-sm text-gray-500">${{seconds(r.status, r.rt)}}</td><td class="px-3 py-2 text-sm text-gray-500">${{escapeHtml(r.extra)}}</td></tr>`);
+                oldest = r.epoch;
+            }}
+            tbody.insertAdjacentHTML('beforeend', html.join(''));
+            tbody.dataset.oldest = Number.isFinite(oldest) ? new Date(oldest).toISOString() : '';
+        }}
+
+        fetch('{data_shards.DATA_DIR}/{data_shards.MANIFEST_FILE}', {{ cache: 'no-cache' }}).then(r => r.json()).then(manifest => {{
+            Object.entries(shardTargets).forEach(([name, id]) => {{
+                const entry = (manifest.targets || {{}})[name];
+                if (!entry) return;
+                const view = {{ remaining: entry.shards.slice(), rows: [], chart: null, phaseChart: null }};
+                const button = document.getElementById(`load-older-${{id}}`);
+                const tbody = document.getElementById(`history-body-${{id}}`);
+                const load = async (wanted, pageRows) => {{
+                    while (view.remaining.length && view.rows.length < wanted) {{
+                        const newest = view.remaining.length === entry.shards.length;
+                        const day = view.remaining.pop();
+                        const response = await fetch(`{data_shards.DATA_DIR}/${{entry.path}}/${{day}}.json`, newest ? {{ cache: 'no-cache' }} : {{}});
+                        if (!response.ok) continue;
+                        const rows = (await response.json()).map(([ts, status, rt, extra, phaseTimes]) => {{
+                            const epoch = Date.parse(ts);
+                            return {{ epoch, status, rt, extra, phases: phaseTimes, label: labelFormat.format(epoch) }};
+                        }});
+                        view.rows = rows.concat(view.rows);
+                    }}
+                    if (pageRows) appendOlderRows(tbody, view.rows);
+                    draw(view, id);
+                    if (button) button.hidden = !view.remaining.length;
+                }};
+                if (button) button.addEventListener('click', () => load(view.rows.length + 1, true));
+                load(recentChecks, false);
+            }});
+        }}).catch(e => console.warn('Dashboard data unavailable:', e));
+    }})();
+    </script>"""
+
+@metrics.timed('snitch_html_render_duration_seconds')
+def generate_html(filename, state_data, history_dir=HISTORY_DIR):
+    """Generates index.html (overview plus a section per target) and refreshes its data shards.
+
+    The page itself stays small: chart data and older history live in
+    time-partitioned shards under data/ next to it, of which only the
+    ones that gained checks since the last run are rewritten.
+    """
+
+    # --- Get Timezone Object ---
+    try:
+        eastern_tz = pytz.timezone(TARGET_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        print(f"Error: Unknown timezone '{TARGET_TIMEZONE}'. Defaulting to UTC.")
+        eastern_tz = timezone.utc # Fallback to UTC
+
+    targets = state_data.get('targets', {})
+    rollup_state = state_data.get('rollups', {})
+    now_epoch = time.time()
+    data_dir = os.path.join(os.path.dirname(filename), data_shards.DATA_DIR)
+    try:
+        data_shards.update_shards(data_dir, history_dir, list(targets))
+    except (IOError, OSError) as e:
+        print(f"Error updating dashboard data shards in '{data_dir}': {e}")
+    sections = []
+    overview_rows = []
+    live_ids = {} # target name -> element id suffix, for live stream updates and shard loading
+    for index, (name, target_state) in enumerate(targets.items()):
+        chart_id = str(index)
+        sections.append(render_target_section(name, target_state, eastern_tz, chart_id, rollup_state.get(name), now_epoch))
+        live_ids[name] = chart_id
+        status = target_state.get('status', 'UNKNOWN')
+        info = STATUS_INFO.get(status, STATUS_INFO["UNKNOWN"])
+        response_time = target_state.get('response_time', 0)
+        response_time_str = f"{response_time:.2f} s" if status != 'UNKNOWN' and isinstance(response_time, (int, float)) and response_time >= 0 else "-- s"
+        overview_rows.append(
+            f"<tr><td class='px-3 py-2 text-sm'><a class='text-indigo-600 hover:underline' href='#target-{chart_id}'>{html.escape(name)}</a></td>"
+            f"<td id='live-overview-status-{chart_id}' class='px-3 py-2 text-sm font-medium {info['history_class']}'>{info['emoji']} {html.escape(status)}</td>"
+            f"<td id='live-overview-time-{chart_id}' class='px-3 py-2 text-sm text-gray-500'>{html.escape(response_time_str)}</td></tr>"
+        )
+
+    sections_html = ''.join(sections)
+    overview_rows_html = ''.join(overview_rows)
+
+    if len(targets) == 1:
+        only_url = next(iter(targets.values())).get('url') or URL
+        watching_html = f'Keeping an eye on: <code class="bg-white/70 px-1 rounded font-mono">{html.escape(only_url)}</code>'
+    else:
+        watching_html = f'Keeping an eye on {len(targets)} targets'
+    overview_html = (
+        f'<section class="mb-10"><h2 class="text-xl font-semibold text-gray-700 mb-3">Overview</h2><div class="overflow-x-auto rounded-lg border border-gray-200"><table class="min-w-full divide-y divide-gray-200 history-table"><thead><tr><th>Target</th><th>Status</th><th>Load Time</th></tr></thead><tbody class="bg-white divide-y divide-gray-200">{overview_rows_html}</tbody></table></div></section>'
+        if len(targets) > 1 else ''
+    )
 
     # --- Main HTML Structure ---
-    # (HTML structure remains the same as check_status_py_final, only content changes)
     html_content = f"""<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -242,64 +629,17 @@ def generate_html(filename, state_data):
     <div class="max-w-4xl mx-auto bg-white/80 backdrop-blur-lg rounded-xl shadow-2xl p-6 md:p-10">
         <header class="mb-6 text-center">
             <h1 class="text-4xl font-extrabold bg-gradient-to-r from-purple-600 to-pink-600 text-transparent bg-clip-text mb-2">Status Snitch ✨</h1>
-            <p class="text-sm text-gray-700">Keeping an eye on: <code class="bg-white/70 px-1 rounded font-mono">{html.escape(URL)}</code></p>
+            <p class="text-sm text-gray-700">{watching_html}</p>
         </header>
-
-        <div id="status-card" class="rounded-lg p-6 mb-8 shadow-lg transition transform duration-500 {info['card_bg_class']} {'animate-pulse-bg' if status in ['SLOW', 'ERROR', 'DOWN'] else ''}">
-            <div class="flex items-center justify-between mb-4 flex-wrap">
-                <h2 class="text-xl font-medium flex items-center {info['text_color']} mb-2 sm:mb-0">
-                    <span class="status-emoji">{info['emoji']}</span>
-                    <span>Current Status:</span> <span id="status-text" class="ml-2 font-semibold">{html.escape(info['text'])}</span>
-                </h2>
-                <span class="text-xs text-gray-500 w-full text-right sm:w-auto">
-                    Checked: <span id="last-checked-display">{html.escape(last_check_local_str)}</span>
-                </span>
-            </div>
-            <div class="grid grid-cols-1 sm:grid-cols-3 gap-4 text-sm">
-                <div class="bg-white/60 rounded-lg p-3 text-center shadow-sm">
-                    <span class="text-gray-600 block text-xs mb-1">Load Speed (Last)</span>
-                    <span id="response-time" class="font-semibold text-lg text-gray-800">{html.escape(response_time_str)}</span>
-                </div>
-                <div class="bg-white/60 rounded-lg p-3 text-center shadow-sm">
-                    {f'<span class="text-gray-600 block text-xs mb-1">Avg. Speed (Last {valid_avg_count})</span>' if valid_avg_count > 0 else '<span class="text-gray-600 block text-xs mb-1">Avg. Speed</span>'}
-                    <span id="avg-speed" class="font-semibold text-lg text-gray-800">{html.escape(average_speed_str)}</span>
-                </div>
-                <div class="bg-white/60 rounded-lg p-3 text-center shadow-sm">
-                    <span class="text-gray-600 block text-xs mb-1">Uptime (Last {len(history)})</span>
-                    <span class="font-semibold text-lg text-gray-800">{uptime_percent:.1f}%</span>
-                </div>
-            </div>
-             {f'<div class="text-xs text-center mt-3 {info["text_color"]}"><p>({html.escape(latest_check_data.get("extra_info", ""))})</p></div>' if status in ["ERROR", "DOWN"] and latest_check_data.get("extra_info") else ''}
-        </div>
-
-        <section class="mb-6">
-            <h2 class="text-xl font-semibold text-gray-700 mb-3">Recent History (Last {len(history)} Checks)</h2>
-            {f'<div class="overflow-x-auto rounded-lg border border-gray-200 max-h-96 overflow-y-auto"><table class="min-w-full divide-y divide-gray-200 history-table"><thead><tr><th class="whitespace-nowrap">Timestamp ({TARGET_TIMEZONE})</th><th class="whitespace-nowrap">Status</th><th class="whitespace-nowrap">Load Time</th><th class="whitespace-nowrap">Details</th></tr></thead><tbody class="bg-white divide-y divide-gray-200">{history_rows_html}</tbody></table></div>' if history else '<p class="text-gray-500">No historical data available yet.</p>'}
-        </section>
-
-        <section class="mb-6">
-            <h2 class="text-xl font-semibold text-gray-700 mb-3">Response Time Trend</h2>
-            <canvas id="history-chart" class="w-full" height="120"></canvas>
-        </section>
-
-        <section class="mb-6">
-            <h2 class="text-xl font-semibold text-gray-700 mb-3">Weekly Averages</h2>
-            {f'<div class="overflow-x-auto rounded-lg border border-gray-200"><table class="min-w-full divide-y divide-gray-200 history-table"><thead><tr><th>Week</th><th>Avg. Load Time</th></tr></thead><tbody>{weekly_rows_html}</tbody></table></div>' if weekly_rows_html else '<p class="text-gray-500">Not enough data for weekly averages.</p>'}
-        </section>
+        {overview_html}
+        {sections_html if targets else '<p class="text-gray-500 text-center">No targets have been checked yet.</p>'}
 
         <div class="text-center text-xs text-gray-400 mt-8">
-            Status checks run automatically every {CHECK_INTERVAL_MINUTES} minutes via GitHub Actions. Page data reflects the last completed check.
+            {f'Status checks run continuously (every {DAEMON_INTERVAL_SECONDS} s by default). Page data is refreshed every {FLUSH_INTERVAL_SECONDS} s.' if state_data.get('daemon') else f'Status checks run automatically every {CHECK_INTERVAL_MINUTES} minutes via GitHub Actions. Page data reflects the last completed check.'}
         </div>
     </div>
-    <script>
-        const chartLabels = {json.dumps(graph_labels)};
-        const chartTimes = {json.dumps(graph_times)};
-        new Chart(document.getElementById('history-chart'), {{
-            type: 'line',
-            data: {{ labels: chartLabels, datasets: [{{ label: 'Load Time (s)', data: chartTimes, borderColor: 'rgb(34, 197, 94)', tension: 0.1, fill: false }}] }},
-            options: {{ scales: {{ y: {{ beginAtZero: true }} }} , plugins: {{ legend: {{ display: false }} }} }}
-        }});
-    </script>
+    {render_shard_script(live_ids) if targets else ''}
+    {render_live_script(live_ids) if STREAM_URL else ''}
 </body>
 </html>"""
 
@@ -311,77 +651,461 @@ def generate_html(filename, state_data):
         print(f"Error writing HTML file '{filename}': {e}")
 
 
-# === MAIN CHECK LOGIC === (No changes needed from previous history version)
-def perform_check():
-    """Performs one status check, updates state including history, and generates output."""
-    print("-" * 30)
+# === PROBE ENGINE ===
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+@contextmanager
+def host_slot(url):
+    """Holds one of the MAX_CONNECTIONS_PER_HOST slots for the URL's host."""
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+    with semaphore:
+        yield
+
+def session_has_idle_connection(session, url):
+    """Whether a requests.Session holds a live idle connection to the URL's host (the next request will reuse it).
+
+    Checked before the request rather than by counting new connections, since
+    a connection closed after an early-stopped read is reopened in place.
+    This reads urllib3 2.x internals; under other versions it reports False rather than failing the check.
+    """
+    parsed = urlparse(url)
+    try:
+        pools = session.get_adapter(url).poolmanager.pools
+        for key in pools.keys():
+            if key.key_host == parsed.hostname and key.key_scheme == parsed.scheme:
+                if any(conn is not None and conn.is_connected for conn in list(pools[key].pool.queue)): return True
+    except (AttributeError, KeyError, TypeError):
+        pass
+    return False
+
+def probe_target(target, session=None):
+    """Probes one target and returns its check record. Never raises.
+
+    Uses requests by default (through `session` when given, so connections
+    stay warm); targets in 'phases' probe mode go through phase_probe and
+    also record per-phase timings. Both record whether a kept-alive
+    connection was reused. The body is streamed through the target's
+    assertions and the download stops once they are decided, so the load
+    time runs until then (with no assertions, the whole body up to the byte cap).
+    """
     check_timestamp_utc = datetime.now(timezone.utc)
-    print(f"Starting check at {check_timestamp_utc.isoformat()}")
-    prev_state = load_previous_state(STATE_FILE)
-    recent_times = prev_state.get('recent_response_times', [])
-    if not isinstance(recent_times, list): recent_times = []
-    history = prev_state.get('history', [])
-    if not isinstance(history, list): history = []
-    stable_count = prev_state.get('stable_count', 0)
-    degraded_count = prev_state.get('degraded_count', 0)
-    alert_mode = prev_state.get('alert_mode', False)
-    start_time = time.time()
     current_status = "UNKNOWN"
     response_time = 0
     extra_info = None
+    measurements = {}
     try:
-        response = requests.get(URL, timeout=TIMEOUT_SECONDS)
-        response_time = time.time() - start_time
-        status_code = response.status_code
-        if status_code == 200:
-            if EXPECTED_KEYWORD and EXPECTED_KEYWORD not in response.text:
-                current_status = "ERROR"; extra_info = "Keyword missing"
+        with host_slot(target['url']):
+            assertions = target['validation']
+            if target.get('probe_mode') == 'phases':
+                validator = validation.start(assertions, target['max_read_bytes'])
+                result = phase_probe.timed_get(target['url'], target['timeout'], verify=target.get('verify_tls', True),
+                                               max_body_bytes=0, on_chunk=lambda chunk: validation.feed(validator, chunk))
+                response_time = result['total']
+                status_code = result['status_code']
+                measurements = {
+                    'phases': {phase: round(seconds, 4) for phase, seconds in result['phases'].items()},
+                    'reused': result['reused'],
+                }
             else:
-                current_status = "SLOW" if response_time > SLOW_THRESHOLD else "UP"
-        else:
-            current_status = "ERROR"; extra_info = f"Status code: {status_code}"
+                reused = session is not None and session_has_idle_connection(session, target['url'])
+                start_time = time.perf_counter()
+                validator = validation.start(assertions, target['max_read_bytes'], started=start_time)
+                response = (session or requests).get(target['url'], timeout=target['timeout'], stream=True, verify=target.get('verify_tls', True))
+                try:
+                    for chunk in response.iter_content(validation.CHUNK_BYTES):
+                        if validation.feed(validator, chunk): break
+                    response_time = time.perf_counter() - start_time
+                finally:
+                    response.close() # Returns a fully read connection to the pool, discards a partly read one
+                status_code = response.status_code
+                measurements = {'reused': reused}
+            outcome = validation.finish(validator)
+            measurements['bytes'] = outcome['bytes_read']
+            if assertions: measurements['first_pass'] = outcome['first_pass']
+            # Only a healthy page's hash is worth comparing; error pages would read as content changes
+            if outcome['content_hash'] and status_code == 200 and outcome['passed']: measurements['content_hash'] = outcome['content_hash']
+            if status_code == 200:
+                if not outcome['passed']:
+                    current_status = "ERROR"; extra_info = outcome['failure']
+                else:
+                    current_status = "SLOW" if response_time > target['slow_threshold'] else "UP"
+            else:
+                current_status = "ERROR"; extra_info = f"Status code: {status_code}"
     except requests.exceptions.Timeout:
         current_status = "DOWN"; response_time = 0; extra_info = "Request timed out"
     except requests.exceptions.RequestException as e:
         current_status = "DOWN"; response_time = 0; extra_info = f"Network error: {type(e).__name__}"
+    except TimeoutError:
+        current_status = "DOWN"; response_time = 0; extra_info = "Request timed out"
+    except (OSError, http.client.HTTPException) as e:
+        current_status = "DOWN"; response_time = 0; extra_info = f"Network error: {type(e).__name__}"
     except Exception as e:
         current_status = "ERROR"; response_time = 0; extra_info = f"Unexpected error: {type(e).__name__}"
-        print(f"!!! Unexpected error during check: {e}")
-    print(f"Check result: Status={current_status}, ResponseTime={response_time:.2f}s, Extra='{extra_info}'")
-    current_check_record = {
+        print(f"!!! Unexpected error during check of {target.get('name')}: {e}")
+    print(f"Check result [{target['name']}]: Status={current_status}, ResponseTime={response_time:.2f}s, Extra='{extra_info}'")
+    return {
         'timestamp': check_timestamp_utc.isoformat().replace('+00:00', 'Z'),
         'status': current_status,
         'response_time': float(f"{response_time:.3f}") if isinstance(response_time, (int, float)) else 0.0,
-        'extra_info': str(extra_info) if extra_info is not None else None
+        'extra_info': str(extra_info) if extra_info is not None else None,
+        **measurements,
     }
-    history.append(current_check_record)
+
+def run_sweep(targets):
+    """Probes all targets concurrently; a sweep takes roughly as long as its slowest target."""
+    if not targets: return {}
+    workers = max(1, min(MAX_WORKERS, len(targets)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='probe') as pool:
+        records = list(pool.map(probe_target, targets))
+    return {target['name']: record for target, record in zip(targets, records)}
+
+def update_target_state(name, url, prev_target_state, check_record, assertions=(), timeout=TIMEOUT_SECONDS):
+    """Folds one check record into a target's state. Returns (new_state, notifications).
+
+    A content hash is compared with the previous check's against the target's
+    hash `assertions`; an unmet expectation turns the check into an ERROR. The load time also feeds the target's anomaly detector; an UP or SLOW
+    check taken while latency is well above the target's own baseline is
+    relabelled DEGRADED in `check_record` itself, so the log and rollups see it too.
+    """
+    recent_times = list(prev_target_state.get('recent_response_times', []))
+    history = list(prev_target_state.get('history', []))
+    stable_count = prev_target_state.get('stable_count', 0)
+    degraded_count = prev_target_state.get('degraded_count', 0)
+    alert_mode = prev_target_state.get('alert_mode', False)
+    previous_hash = prev_target_state.get('content_hash')
+    content_hash = check_record.get('content_hash') if check_record['status'] in ("UP", "SLOW") else None # Failed checks keep the previous hash
+    hash_failure = validation.hash_failure(assertions, previous_hash, content_hash)
+    if hash_failure and check_record['status'] in ("UP", "SLOW"):
+        check_record['status'] = "ERROR"; check_record['extra_info'] = hash_failure
+    detector = prev_target_state.get('anomaly') or anomaly.new_detector()
+    baseline_latency = latency_for_rollup(check_record, timeout) if check_record['status'] in ("UP", "SLOW") else None
+    verdict = anomaly.observe(detector, history_store.parse_timestamp(check_record['timestamp']), baseline_latency)
+    if verdict['degraded'] and check_record['status'] in ("UP", "SLOW") and verdict['expected'] is not None:
+        check_record['status'] = "DEGRADED"
+        check_record['extra_info'] = f"Load time {check_record['response_time']:.2f}s, usually {verdict['expected']:.2f}s"
+    current_status = check_record['status']
+    response_time = check_record['response_time']
+    history.append(check_record)
     history = history[-MAX_HISTORY_RECORDS:]
-    current_time_for_avg = response_time if current_status in ["UP", "SLOW"] else 0
+    current_time_for_avg = response_time if current_status in ["UP", "SLOW", "DEGRADED"] else 0
     recent_times.append(current_time_for_avg)
     recent_times = recent_times[-MAX_RESPONSE_TIMES_TO_KEEP:]
-    if current_status == "UP": stable_count += 1; degraded_count = 0
+    latency_sketch = prev_target_state.get('latency_sketch') or sketch.new_sketch()
+    connection_sketches = prev_target_state.get('connection_sketches') or {'cold': sketch.new_sketch(), 'warm': sketch.new_sketch()}
+    latency = latency_for_rollup(check_record, timeout)
+    if latency is not None:
+        sketch.add(latency_sketch, latency)
+        sketch.add(connection_sketches['warm' if check_record.get('reused') else 'cold'], latency)
+    # SLOW is an absolute label; once a baseline exists it only counts against a target when DEGRADED says it is unusual
+    healthy = current_status == "UP" or (current_status == "SLOW" and verdict['warm'])
+    if healthy: stable_count += 1; degraded_count = 0
     else: degraded_count += 1; stable_count = 0
     new_alert_mode = alert_mode
-    if not alert_mode and degraded_count >= 2: new_alert_mode = True; print("Condition met to enter ALERT mode.")
-    elif alert_mode and stable_count >= 3: new_alert_mode = False; print("Condition met to exit ALERT mode.")
-    current_state_data = {
-        'status': current_status, 'response_time': response_time, 'extra_info': extra_info,
+    if not alert_mode and degraded_count >= 2: new_alert_mode = True; print(f"[{name}] Condition met to enter ALERT mode.")
+    elif alert_mode and stable_count >= 3: new_alert_mode = False; print(f"[{name}] Condition met to exit ALERT mode.")
+    new_target_state = {
+        'url': url, 'status': current_status, 'response_time': response_time, 'extra_info': check_record['extra_info'],
         'stable_count': stable_count, 'degraded_count': degraded_count, 'alert_mode': new_alert_mode,
-        'last_check_timestamp_utc': current_check_record['timestamp'],
-        'recent_response_times': recent_times, 'history': history
+        'last_check_timestamp_utc': check_record['timestamp'],
+        'recent_response_times': recent_times, 'latency_sketch': latency_sketch,
+        'connection_sketches': connection_sketches, 'anomaly': detector,
+        'content_hash': content_hash or previous_hash, 'history': history
     }
-    if current_status != prev_state.get('status'):
-        send_slack_notification(f"Status changed to {current_status} ({response_time:.2f}s)")
+    notifications = []
+    if current_status != prev_target_state.get('status'):
+        notifications.append({'kind': 'status', 'status': current_status, 'message': f"[{name}] Status changed to {current_status} ({response_time:.2f}s)"})
+    if validation.watches_changes(assertions) and previous_hash and content_hash and content_hash != previous_hash:
+        notifications.append({'kind': 'content', 'message': f"[{name}] Content changed"})
     if new_alert_mode and not alert_mode:
-        send_slack_notification("Entering ALERT mode")
+        notifications.append({'kind': 'alert_mode', 'message': f"[{name}] Entering ALERT mode"})
     if alert_mode and not new_alert_mode:
-        send_slack_notification("Alert resolved")
+        notifications.append({'kind': 'alert_mode', 'message': f"[{name}] Alert resolved"})
+    return new_target_state, notifications
+
+
+# === MAIN CHECK LOGIC ===
+def perform_check():
+    """Performs one sweep over all targets, updates keyed state including history, and generates output."""
+    print("-" * 30)
+    print(f"Starting check at {datetime.now(timezone.utc).isoformat()}")
+    targets = load_targets(TARGETS_FILE)
+    prev_state = load_previous_state(STATE_FILE, timeouts=target_timeouts(targets))
+    sweep_started = time.time()
+    records = run_sweep(targets)
+    print(f"Swept {len(targets)} target(s) in {time.time() - sweep_started:.2f}s")
+    metrics.observe('snitch_sweep_duration_seconds', time.time() - sweep_started)
+    alerts.init(send_slack_notification, ALERT_OUTBOX_FILE)
+    queue_notifications({target['name']: apply_check_result(prev_state, target, records[target['name']]) for target in targets})
+    alerts.start() # Delivers in the background while state and HTML are written
+    current_state_data = registry_state(prev_state, targets)
+    history_store.append_records(HISTORY_DIR, [{'target': name, **record} for name, record in records.items()])
+    history_store.maintain_history(HISTORY_DIR)
     save_current_state(STATE_FILE, current_state_data)
     generate_html(OUTPUT_HTML_FILE, current_state_data)
+    alerts.stop(ALERT_FLUSH_TIMEOUT_SECONDS)
+    if metrics.ENABLED and metrics.METRICS_FILE:
+        metrics.set_gauge('snitch_alert_queue_depth', alerts.queue_depth())
+        metrics.write_textfile(metrics.METRICS_FILE)
     print(f"Finished check processing at {datetime.now(timezone.utc).isoformat()}")
     print("-" * 30)
 
 
+# === DAEMON MODE ===
+
+def apply_check_result(state, target, check_record):
+    """Folds a check record into the in-memory state (target record and rollups). Returns notifications."""
+    name = target['name']
+    prev_target_state = state['targets'].get(name) or default_target_state()
+    state['targets'][name], notifications = update_target_state(name, target['url'], prev_target_state, check_record, target.get('validation', ()), target['timeout'])
+    rollup_check(state['rollups'], name, check_record, target['timeout'])
+    if metrics.ENABLED: record_check_metrics(name, check_record)
+    if check_record['timestamp'] > (state.get('last_check_timestamp_utc') or ''):
+        state['last_check_timestamp_utc'] = check_record['timestamp']
+    return notifications
+
+def record_check_metrics(name, check_record):
+    status = check_record['status']
+    metrics.inc('snitch_checks', target=name, status=status)
+    metrics.set_status(name, status)
+    metrics.set_gauge('snitch_target_response_seconds', check_record['response_time'], target=name)
+    if status in rollups.UP_STATUSES and check_record['response_time'] > 0:
+        metrics.observe('snitch_probe_duration_seconds', check_record['response_time'], target=name)
+
+def registry_state(state, targets):
+    """The slice of the state covering the registry's targets (targets dropped from the registry are forgotten)."""
+    names = [t['name'] for t in targets]
+    return {
+        'targets': {name: state['targets'].get(name) or default_target_state() for name in names},
+        'rollups': {name: state['rollups'].setdefault(name, {}) for name in names},
+        'last_check_timestamp_utc': state.get('last_check_timestamp_utc'),
+    }
+
+def target_interval(target):
+    """Seconds between checks for a target, clamped to MIN_INTERVAL_SECONDS."""
+    try:
+        return max(MIN_INTERVAL_SECONDS, float(target.get('interval') or DAEMON_INTERVAL_SECONDS))
+    except (TypeError, ValueError):
+        return float(DAEMON_INTERVAL_SECONDS)
+
+def jittered(anchor, interval):
+    return anchor + random.uniform(-SCHEDULE_JITTER, SCHEDULE_JITTER) * interval
+
+def install_stop_handlers():
+    """Event set on SIGTERM/SIGINT, so long-running modes finish in-flight work before exiting."""
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}, shutting down after in-flight checks.")
+        stop_event.set()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    return stop_event
+
+def run_schedule(targets, check, stop_event, periodic=None, period=FLUSH_INTERVAL_SECONDS):
+    """Calls check(target) for each target on its own interval until stop_event is set.
+
+    Runs are anchored to a fixed schedule (anchor += interval) and jittered
+    around it, so delays do not accumulate and missed slots are skipped rather
+    than bunched. A target whose previous check is still running skips its slot.
+    `periodic` is called every `period` seconds. Returns once in-flight checks finish.
+    """
+    targets_by_name = {t['name']: t for t in targets}
+    in_flight = set()
+    in_flight_lock = threading.Lock()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(targets))), thread_name_prefix='probe')
+
+    def run_check(name):
+        try:
+            check(targets_by_name[name])
+        finally:
+            with in_flight_lock: in_flight.discard(name)
+
+    # Spread first runs across each target's interval so a large registry does not fire at once
+    now = time.monotonic()
+    schedule = []
+    for sequence, target in enumerate(targets):
+        anchor = now + random.uniform(0, min(target_interval(target), MIN_INTERVAL_SECONDS))
+        heapq.heappush(schedule, (anchor, sequence, target['name'], anchor))
+    next_periodic = now + period
+    try:
+        while not stop_event.is_set():
+            now = time.monotonic()
+            while schedule and schedule[0][0] <= now:
+                _, sequence, name, anchor = heapq.heappop(schedule)
+                with in_flight_lock:
+                    already_running = name in in_flight
+                    in_flight.add(name)
+                if already_running:
+                    print(f"[{name}] Previous check still running, skipping this slot")
+                else:
+                    pool.submit(run_check, name)
+                interval = target_interval(targets_by_name[name])
+                anchor += interval
+                if anchor <= now: anchor += interval * ((now - anchor) // interval + 1) # Skip missed slots
+                heapq.heappush(schedule, (jittered(anchor, interval), sequence, name, anchor))
+            if now >= next_periodic:
+                if periodic: periodic()
+                next_periodic += period
+                if next_periodic <= now: next_periodic = now + period
+            next_wake = min(schedule[0][0] if schedule else next_periodic, next_periodic)
+            stop_event.wait(max(0.0, next_wake - time.monotonic()))
+    finally:
+        pool.shutdown(wait=True)
+
+def run_daemon():
+    """Checks targets continuously until SIGTERM/SIGINT.
+
+    Each target has its own interval (see run_schedule) and keeps a
+    requests.Session, so checks after the first reuse warm connections.
+    Records are appended to the check log as they complete. State and HTML
+    are flushed every FLUSH_INTERVAL_SECONDS and once more on shutdown.
+    With METRICS_ENABLED, /metrics is served on METRICS_PORT.
+    """
+    stop_event = install_stop_handlers()
+    targets = load_targets(TARGETS_FILE)
+    state = load_previous_state(STATE_FILE, timeouts=target_timeouts(targets))
+    sessions = {t['name']: requests.Session() for t in targets}
+    state_lock = threading.Lock()
+    alerts.init(send_slack_notification, ALERT_OUTBOX_FILE)
+    alerts.start()
+    metrics_server = None
+    if metrics.ENABLED:
+        metrics.register_collector(lambda: [('snitch_alert_queue_depth', {}, alerts.queue_depth())])
+        metrics_server = metrics.start_http_server(metrics.METRICS_PORT)
+
+    def check_and_record(target):
+        name = target['name']
+        record = probe_target(target, sessions[name])
+        with state_lock:
+            notifications = apply_check_result(state, target, record)
+            history_store.append_records(HISTORY_DIR, [{'target': name, **record}])
+        queue_notifications({name: notifications})
+
+    def flush():
+        with state_lock:
+            snapshot = registry_state(state, targets)
+            snapshot['daemon'] = True
+            save_current_state(STATE_FILE, snapshot)
+            generate_html(OUTPUT_HTML_FILE, snapshot)
+        history_store.maintain_history(HISTORY_DIR)
+
+    print(f"Daemon started: {len(targets)} target(s), flushing every {FLUSH_INTERVAL_SECONDS}s")
+    try:
+        run_schedule(targets, check_and_record, stop_event, flush)
+    finally:
+        flush()
+        alerts.stop(ALERT_FLUSH_TIMEOUT_SECONDS)
+        for session in sessions.values(): session.close()
+        phase_probe.close_idle_connections()
+        if metrics_server is not None: metrics_server.shutdown()
+        print("Daemon stopped.")
+
+
+# === FLEET MODE ===
+
+def run_worker(location, index, workers, spool_dir=fleet.SPOOL_DIR):
+    """Probes this worker's shard of the registry until SIGTERM/SIGINT, spooling records for the aggregator.
+
+    Targets are split between the `workers` processes of a location by
+    consistent hashing (fleet.shard_targets); every location probes every target.
+    Records go to spool_dir/<location>-w<index>/ and carry the location label.
+    The worker keeps no state of its own: status, alerts and the dashboard are the aggregator's.
+    """
+    stop_event = install_stop_handlers()
+    targets = fleet.shard_targets(load_targets(TARGETS_FILE), index, workers)
+    directory = os.path.join(spool_dir, fleet.worker_id(location, index))
+    sessions = {t['name']: requests.Session() for t in targets}
+    spool_lock = threading.Lock()
+
+    def check_and_spool(target):
+        record = probe_target(target, sessions[target['name']])
+        with spool_lock:
+            history_store.append_records(directory, [{'target': target['name'], 'location': location, **record}])
+
+    print(f"Worker {index + 1}/{workers} at '{location}': {len(targets)} target(s), spooling to {directory}")
+    try:
+        run_schedule(targets, check_and_spool, stop_event, lambda: fleet.maintain_spool(directory))
+    finally:
+        for session in sessions.values(): session.close()
+        phase_probe.close_idle_connections()
+        print("Worker stopped.")
+
+def aggregate_step(state, fleet_state, targets, spool_dir):
+    """Merges newly spooled checks into `state` and the check log. Returns notifications by target."""
+    windows = {t['name']: target_interval(t) for t in targets}
+    slow_thresholds = {t['name']: t['slow_threshold'] for t in targets}
+    targets_by_name = {t['name']: t for t in targets}
+    merged = fleet.merge(fleet_state, fleet.read_spools(spool_dir, fleet_state), windows, slow_thresholds, time.time())
+    notifications, log_records = {}, []
+    for record in merged:
+        name = record.pop('target')
+        notifications.setdefault(name, []).extend(apply_check_result(state, targets_by_name[name], record))
+        log_records.append({'target': name, **record})
+    history_store.append_records(HISTORY_DIR, log_records)
+    return notifications
+
+def run_aggregator(spool_dir=fleet.SPOOL_DIR, once=False):
+    """Merges the workers' spools into status, the check log, alerts and the dashboard.
+
+    Every AGGREGATE_INTERVAL_SECONDS the spools are read from their saved
+    cursors and each target's checks per interval become one quorum record
+    (see fleet.merge), folded in exactly like a local check. With `once`, a
+    single pass is made (for cron); otherwise it runs until SIGTERM/SIGINT.
+    """
+    stop_event = install_stop_handlers()
+    targets = load_targets(TARGETS_FILE)
+    state = load_previous_state(STATE_FILE, timeouts=target_timeouts(targets))
+    fleet_state = fleet.load_aggregator_state(fleet.FLEET_STATE_FILE)
+    alerts.init(send_slack_notification, ALERT_OUTBOX_FILE)
+    alerts.start()
+
+    def flush():
+        snapshot = registry_state(state, targets)
+        snapshot['daemon'] = not once
+        save_current_state(STATE_FILE, snapshot)
+        generate_html(OUTPUT_HTML_FILE, snapshot)
+        history_store.maintain_history(HISTORY_DIR)
+
+    print(f"Aggregating {len(targets)} target(s) from {spool_dir}")
+    next_flush = time.monotonic() + FLUSH_INTERVAL_SECONDS
+    try:
+        while True:
+            queue_notifications(aggregate_step(state, fleet_state, targets, spool_dir))
+            fleet.save_aggregator_state(fleet.FLEET_STATE_FILE, fleet_state) # After the log append: a crash re-merges rather than loses
+            if once or stop_event.wait(AGGREGATE_INTERVAL_SECONDS): break
+            if time.monotonic() >= next_flush:
+                flush()
+                next_flush = time.monotonic() + FLUSH_INTERVAL_SECONDS
+    finally:
+        flush()
+        alerts.stop(ALERT_FLUSH_TIMEOUT_SECONDS)
+        print("Aggregator stopped.")
+
+
 # === SCRIPT EXECUTION ===
 if __name__ == "__main__":
-    perform_check()
+    parser = argparse.ArgumentParser(description="Check target status and regenerate the dashboard.")
+    parser.add_argument('--daemon', action='store_true', help="keep running, checking each target on its own interval")
+    parser.add_argument('--worker', action='store_true', help="fleet probe worker: check this worker's shard and spool the records")
+    parser.add_argument('--location', default=os.getenv('PROBE_LOCATION', 'local'), help="location label of this worker")
+    parser.add_argument('--worker-index', type=int, default=0, help="this worker's index within its location")
+    parser.add_argument('--workers', type=int, default=1, help="number of workers in this location")
+    parser.add_argument('--aggregate', action='store_true', help="fleet aggregator: merge worker spools by quorum")
+    parser.add_argument('--once', action='store_true', help="with --aggregate, merge what has arrived and exit")
+    parser.add_argument('--spool', default=fleet.SPOOL_DIR, help="spool directory shared by workers and the aggregator")
+    args = parser.parse_args()
+    if args.worker:
+        if not 0 <= args.worker_index < args.workers: parser.error("--worker-index must be below --workers")
+        run_worker(args.location, args.worker_index, args.workers, args.spool)
+    elif args.aggregate:
+        run_aggregator(args.spool, args.once)
+    elif args.daemon:
+        run_daemon()
+    else:
+        perform_check()
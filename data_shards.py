@@ -0,0 +1,131 @@
+# Time-partitioned dashboard data for Status Snitch.
+# index.html is a small shell without chart data; each target's checks are
+# published as one compact JSON shard per UTC day under data/<target>/ and
+# listed in data/manifest.json, so the page fetches the recent window first and
+# pages older days on demand. An update only rewrites the shards that gained checks.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone, timedelta
+import history_store
+
+# === CONFIGURATION ===
+DATA_DIR = 'data' # Next to index.html, so the page can fetch it relatively
+MANIFEST_FILE = 'manifest.json'
+SHARD_TIME_FORMAT = '%Y-%m-%d'
+RETENTION_DAYS = history_store.RETENTION_DAYS
+
+# === HELPER FUNCTIONS ===
+
+def target_slug(name):
+    """Directory name for a target's shards: readable, filesystem and URL safe, and unique per name."""
+    readable = re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('._')[:40] or 'target'
+    return f"{readable}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:6]}"
+
+def shard_day(ts_epoch):
+    return datetime.fromtimestamp(ts_epoch, timezone.utc).strftime(SHARD_TIME_FORMAT)
+
+def shard_row(record):
+    """Compact row: [timestamp, status, response_time, extra_info, phases or null]."""
+    return [record['timestamp'], record.get('status', 'UNKNOWN'), record.get('response_time', 0), record.get('extra_info'), record.get('phases')]
+
+def load_manifest(data_dir):
+    try:
+        with open(os.path.join(data_dir, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get('targets'), dict): return manifest
+    except (IOError, json.JSONDecodeError, AttributeError):
+        pass
+    return {'targets': {}, 'generated_at': None}
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+
+def _load_rows(path):
+    try:
+        with open(path, 'r') as f:
+            rows = json.load(f)
+        return rows if isinstance(rows, list) else []
+    except (IOError, json.JSONDecodeError):
+        return []
+
+# === SHARD UPDATES ===
+
+def update_shards(data_dir, history_dir, target_names, now=None):
+    """Folds checks logged since the last update into their day shards and refreshes the manifest.
+
+    Only the log written since the oldest target's last published check is
+    read (the whole log once, for targets seen for the first time). Shards
+    older than RETENTION_DAYS are deleted. Returns the manifest.
+    """
+    now = now or datetime.now(timezone.utc)
+    manifest = load_manifest(data_dir)
+    entries = {name: manifest['targets'].get(name) or {'path': target_slug(name), 'shards': [], 'last_timestamp': None} for name in target_names}
+    last_epochs = {name: history_store.parse_timestamp(e['last_timestamp']) if e['last_timestamp'] else None for name, e in entries.items()}
+    if not entries or None in last_epochs.values(): since = None
+    else: since = min(last_epochs.values()) - history_store.ORDER_SLACK_SECONDS
+
+    new_rows = {} # (name, day) -> rows
+    for record in history_store.read_history(history_dir, since=since):
+        name = record.get('target')
+        if name not in entries: continue
+        try:
+            ts_epoch = history_store.parse_timestamp(record['timestamp'])
+        except (KeyError, ValueError, AttributeError):
+            continue
+        if last_epochs[name] is not None and ts_epoch <= last_epochs[name] - history_store.ORDER_SLACK_SECONDS: continue
+        new_rows.setdefault((name, shard_day(ts_epoch)), []).append((ts_epoch, shard_row(record)))
+
+    changed = set(manifest['targets']) != set(entries)
+    written = 0
+    for (name, day), rows in sorted(new_rows.items()):
+        entry = entries[name]
+        target_dir = os.path.join(data_dir, entry['path'])
+        os.makedirs(target_dir, exist_ok=True)
+        path = os.path.join(target_dir, f"{day}.json")
+        existing = _load_rows(path) if day in entry['shards'] else []
+        seen = {row[0] for row in existing}
+        added = [(ts_epoch, row) for ts_epoch, row in rows if row[0] not in seen]
+        if not added: continue
+        added.sort(key=lambda item: item[0])
+        if not existing or added[0][0] >= history_store.parse_timestamp(existing[-1][0]):
+            rows_out = existing + [row for _, row in added] # Usual case: checks only arrive at the end
+        else:
+            merged = sorted([(history_store.parse_timestamp(row[0]), row) for row in existing] + added, key=lambda item: item[0])
+            rows_out = [row for _, row in merged]
+        _write_json(path, rows_out)
+        if day not in entry['shards']: entry['shards'] = sorted(entry['shards'] + [day])
+        newest_epoch = history_store.parse_timestamp(rows_out[-1][0])
+        if last_epochs[name] is None or newest_epoch > last_epochs[name]:
+            entry['last_timestamp'], last_epochs[name] = rows_out[-1][0], newest_epoch
+        written += 1
+        changed = True
+
+    cutoff_day = (now - timedelta(days=RETENTION_DAYS)).strftime(SHARD_TIME_FORMAT)
+    for entry in entries.values():
+        expired = [day for day in entry['shards'] if day < cutoff_day]
+        for day in expired:
+            try:
+                os.remove(os.path.join(data_dir, entry['path'], f"{day}.json"))
+            except OSError:
+                pass
+        if expired:
+            entry['shards'] = [day for day in entry['shards'] if day >= cutoff_day]
+            changed = True
+
+    for name, entry in manifest['targets'].items():
+        if name not in entries and isinstance(entry, dict) and entry.get('path'):
+            shutil.rmtree(os.path.join(data_dir, entry['path']), ignore_errors=True) # Target left the registry
+
+    manifest = {'targets': entries, 'generated_at': manifest.get('generated_at')}
+    if changed:
+        os.makedirs(data_dir, exist_ok=True)
+        manifest['generated_at'] = now.isoformat().replace('+00:00', 'Z')
+        _write_json(os.path.join(data_dir, MANIFEST_FILE), manifest)
+        print(f"Updated dashboard data shards ({written} shard(s) rewritten)")
+    return manifest
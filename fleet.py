@@ -0,0 +1,247 @@
+# Distributed prober fleet for Status Snitch.
+# Probe workers (`check_status.py --worker`) run per location, split the
+# registry between them by consistent hashing, and append their check records
+# to a spool directory each (the same hourly segment format as the check log).
+# The aggregator (`check_status.py --aggregate`) reads every spool from its
+# saved cursors, merges the streams in timestamp order behind a watermark,
+# and turns each target's checks per interval into one record whose status
+# is decided by quorum over every location's latest check: DOWN or ERROR only
+# when most reporting locations agree (and at least MIN_QUORUM_LOCATIONS report),
+# so one runner's bad network does not take a target down.
+# End-to-end demo on one machine (stub target server, worker processes, aggregator):
+#   python fleet.py demo [--locations 3] [--workers 2] [--seconds 45]
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bisect import bisect
+import history_store
+
+# === CONFIGURATION ===
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+FLEET_STATE_FILE = os.getenv('FLEET_STATE_FILE', 'fleet_state.json') # Aggregator cursors and unmerged checks
+VNODES = 64 # Points per worker on the hash ring
+QUORUM_FRACTION = float(os.getenv('QUORUM_FRACTION', 0.5)) # Failing locations must exceed this share
+MIN_QUORUM_LOCATIONS = int(os.getenv('MIN_QUORUM_LOCATIONS', 2)) # Locations that must report before DOWN/ERROR (1 for a single-location fleet)
+VOTE_MAX_AGE_WINDOWS = 2 # A location's latest check counts for this many intervals, bridging schedule jitter
+STALE_WORKER_SECONDS = int(os.getenv('STALE_WORKER_SECONDS', 180)) # Silent workers stop holding the watermark back
+SPOOL_RETENTION_DAYS = 2
+MAX_PENDING_RECORDS = 100000
+FAILING_STATUSES = ('DOWN', 'ERROR')
+CARRIED_FIELDS = ('phases', 'bytes', 'reused', 'first_pass', 'content_hash') # Copied from the representative check
+
+# === SHARDING ===
+
+def ring_hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+def build_ring(nodes, vnodes=VNODES):
+    """Consistent hash ring as (sorted point hashes, owning node per point)."""
+    points = sorted((ring_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(vnodes))
+    return [h for h, _ in points], [node for _, node in points]
+
+def ring_owner(ring, key):
+    hashes, nodes = ring
+    return nodes[bisect(hashes, ring_hash(key)) % len(hashes)]
+
+def shard_targets(targets, index, workers):
+    """Targets probed by worker `index` of `workers` in a location. Changing `workers` moves only ~1/workers of them."""
+    ring = build_ring([str(i) for i in range(workers)])
+    return [t for t in targets if ring_owner(ring, t['name']) == str(index)]
+
+def worker_id(location, index):
+    """Spool directory name for a worker: filesystem-safe location plus index."""
+    return f"{re.sub(r'[^A-Za-z0-9_-]+', '_', location) or 'location'}-w{index}"
+
+# === AGGREGATION ===
+
+def new_aggregator_state():
+    return {'cursors': {}, 'workers': {}, 'pending': [], 'emitted': {}, 'votes': {}}
+
+def load_aggregator_state(filename):
+    state = new_aggregator_state()
+    if not os.path.exists(filename): return state
+    try:
+        with open(filename, 'r') as f:
+            stored = json.load(f)
+        for key in state:
+            if isinstance(stored.get(key), type(state[key])): state[key] = stored[key]
+    except (IOError, json.JSONDecodeError, AttributeError) as e:
+        print(f"Aggregator state '{filename}' invalid, re-reading the spools. Error: {e}")
+    return state
+
+def save_aggregator_state(filename, state):
+    try:
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(filename + '.tmp', filename)
+    except IOError as e:
+        print(f"Error saving aggregator state '{filename}': {e}")
+
+def read_spools(spool_dir, state):
+    """New records from every worker spool since its saved cursor (the cursors are advanced in `state`)."""
+    records = []
+    if not os.path.isdir(spool_dir): return records
+    for worker in sorted(os.listdir(spool_dir)):
+        path = os.path.join(spool_dir, worker)
+        if not os.path.isdir(path): continue
+        cursor = state['cursors'].get(worker)
+        for position, record in history_store.iter_positions(path, tuple(cursor) if cursor else None):
+            record['worker'] = worker
+            records.append(record)
+            state['cursors'][worker] = list(position)
+    return records
+
+def watermark(state, now):
+    """Checks before this time have arrived from every live worker. Silent workers are not waited for."""
+    live = [w['max_ts'] for w in state['workers'].values() if now - w['max_ts'] <= STALE_WORKER_SECONDS]
+    return min(live) if live else now - STALE_WORKER_SECONDS
+
+def quorum_record(latest, slow_threshold):
+    """One check record from the latest check of each reporting location ({location: check})."""
+    failing = [v for v in latest.values() if v['status'] in FAILING_STATUSES]
+    healthy = sorted((v for v in latest.values() if v['status'] not in FAILING_STATUSES), key=lambda v: v.get('response_time') or 0)
+    newest = max(latest.values(), key=lambda v: v['ts'])
+    if len(failing) > QUORUM_FRACTION * len(latest) and len(latest) < MIN_QUORUM_LOCATIONS:
+        # Too few locations to tell the target failing from the reporting locations' networks
+        reporting = ', '.join(sorted(f"{location}: {v.get('extra_info')}" for location, v in latest.items()))
+        record = {'status': 'UNKNOWN', 'response_time': 0.0, 'extra_info': f"Only {len(latest)}/{MIN_QUORUM_LOCATIONS} locations reporting ({reporting})"}
+    elif len(failing) > QUORUM_FRACTION * len(latest):
+        status = 'DOWN' if 2 * sum(v['status'] == 'DOWN' for v in failing) >= len(failing) else 'ERROR'
+        representative = next(v for v in failing if v['status'] == status)
+        record = {'status': status, 'response_time': 0.0, 'extra_info': f"{representative.get('extra_info')} ({len(failing)}/{len(latest)} locations)"}
+    else:
+        representative = healthy[len(healthy) // 2] # Median load time across locations
+        dissent = f"{len(failing)}/{len(latest)} locations failing: {', '.join(sorted(str(v.get('location')) for v in failing))}" if failing else None
+        status = 'SLOW' if representative['response_time'] > slow_threshold else 'UP'
+        record = {'status': status, 'response_time': representative['response_time'], 'extra_info': dissent}
+        record.update({k: representative[k] for k in CARRIED_FIELDS if k in representative})
+    return {
+        'target': newest['target'], 'timestamp': newest['timestamp'], **record,
+        'locations': {location: vote['status'] for location, vote in sorted(latest.items())},
+    }
+
+def merge(state, records, windows, slow_thresholds, now):
+    """Folds newly read records into `state` and returns merged records for every interval the watermark has passed.
+
+    `windows` maps each registry target to its check interval in seconds and
+    `slow_thresholds` to its SLOW threshold. Each target's checks are bucketed by its interval; a bucket is merged
+    once every live worker has reported past its end, and results come out
+    in timestamp order. Checks arriving after their bucket was merged are dropped.
+
+    Workers run on their own jittered schedules, so a location's check may
+    land in the neighbouring bucket. The quorum therefore counts each
+    location's latest check from the last VOTE_MAX_AGE_WINDOWS intervals, not just the bucket's own.
+    """
+    for record in records:
+        try:
+            record['ts'] = history_store.parse_timestamp(record['timestamp'])
+        except (KeyError, ValueError, AttributeError):
+            continue
+        worker = state['workers'].setdefault(record['worker'], {'max_ts': record['ts']})
+        worker['max_ts'] = max(worker['max_ts'], record['ts'])
+        state['pending'].append(record)
+    if len(state['pending']) > MAX_PENDING_RECORDS:
+        print(f"Aggregator backlog over {MAX_PENDING_RECORDS} checks, dropping the oldest")
+        state['pending'] = sorted(state['pending'], key=lambda r: r['ts'])[-MAX_PENDING_RECORDS:]
+    mark = watermark(state, now)
+    buckets, keep, late = {}, [], 0
+    for record in state['pending']:
+        window = windows.get(record.get('target'))
+        if window is None: continue # Left the registry
+        bucket = int(record['ts'] // window)
+        if bucket <= state['emitted'].get(record['target'], -1): late += 1
+        elif (bucket + 1) * window <= mark: buckets.setdefault((record['target'], bucket), []).append(record)
+        else: keep.append(record)
+    if late: print(f"Dropped {late} check(s) that arrived after their interval was merged")
+    state['pending'] = keep
+    merged = []
+    for (name, bucket), votes in sorted(buckets.items()):
+        latest = state['votes'].setdefault(name, {})
+        for vote in sorted(votes, key=lambda v: v['ts']): latest[str(vote.get('location'))] = vote
+        oldest = (bucket + 1 - VOTE_MAX_AGE_WINDOWS) * windows[name]
+        for location in [loc for loc, vote in latest.items() if vote['ts'] < oldest]: del latest[location]
+        merged.append(quorum_record(latest, slow_thresholds[name]))
+        state['emitted'][name] = bucket
+    for name in [n for n in state['votes'] if n not in windows]: del state['votes'][name]
+    merged.sort(key=lambda r: history_store.parse_timestamp(r['timestamp']))
+    return merged
+
+def maintain_spool(directory):
+    """Gzips and expires a worker's spool segments; the aggregator reads them well before they expire."""
+    history_store.compact_segments(directory)
+    history_store.prune_history(directory, max_age_days=SPOOL_RETENTION_DAYS)
+
+# === DEMO ===
+
+def run_demo(location_count, workers, seconds, interval):
+    """Runs a fleet against a local stub server. The last location's network is broken via a dead HTTP proxy."""
+    import stub_server
+    workdir = tempfile.mkdtemp(prefix='snitch-fleet-')
+    server, base_url = stub_server.start_stub_server()
+    checker = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'check_status.py')
+    targets = [{'name': f"site-{index}", 'url': f"{base_url}/?bytes={2000 + index * 500}&delay=0.0{index % 5}"} for index in range(8)]
+    targets.append({'name': 'broken', 'url': f"{base_url}/?status=503"})
+    with open(os.path.join(workdir, 'targets.json'), 'w') as f:
+        json.dump({'defaults': {'interval': interval}, 'targets': targets}, f)
+    env = {**os.environ, 'TARGETS_FILE': 'targets.json', 'PYTHONUNBUFFERED': '1'}
+    locations = [f"loc-{chr(ord('a') + index)}" for index in range(location_count)]
+    processes = []
+    try:
+        for location in locations:
+            worker_env = dict(env)
+            if location == locations[-1] and location_count > 1: worker_env['HTTP_PROXY'] = 'http://127.0.0.1:9' # Simulated bad runner network
+            for index in range(workers):
+                log = open(os.path.join(workdir, f"{worker_id(location, index)}.log"), 'w')
+                processes.append(subprocess.Popen([sys.executable, checker, '--worker', '--location', location, '--worker-index', str(index), '--workers', str(workers)],
+                                                  cwd=workdir, env=worker_env, stdout=log, stderr=subprocess.STDOUT))
+        print(f"Started {len(processes)} worker(s) across {location_count} location(s) in {workdir}; {locations[-1] if location_count > 1 else 'no location'} has a broken network")
+        aggregator_log = open(os.path.join(workdir, 'aggregator.log'), 'w')
+        aggregator_env = {**env, 'MIN_QUORUM_LOCATIONS': str(min(MIN_QUORUM_LOCATIONS, location_count))}
+        aggregator = subprocess.Popen([sys.executable, checker, '--aggregate'], cwd=workdir, env=aggregator_env, stdout=aggregator_log, stderr=subprocess.STDOUT)
+        processes.append(aggregator)
+        time.sleep(seconds)
+    finally:
+        for process in processes: process.terminate()
+        for process in processes: process.wait(timeout=30)
+        server.shutdown()
+    with open(os.path.join(workdir, 'status.json'), 'r') as f:
+        state = json.load(f)
+    merged = history_store.read_history(os.path.join(workdir, history_store.HISTORY_DIR))
+    print(f"Aggregated {len(merged)} quorum check(s); final status per target:")
+    for name, target_state in sorted(state['targets'].items()):
+        print(f"  {name:<8} {target_state['status']:<6} {target_state.get('extra_info') or ''}")
+    latest = merged[-1] if merged else {}
+    print(f"Latest merged record: {json.dumps(latest)}")
+    return workdir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prober fleet utilities.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    demo = commands.add_parser('demo', help='run workers and an aggregator against a local stub server')
+    demo.add_argument('--locations', type=int, default=3)
+    demo.add_argument('--workers', type=int, default=2, help='workers per location')
+    demo.add_argument('--seconds', type=float, default=45)
+    demo.add_argument('--interval', type=int, default=10, help='seconds between checks of each target')
+    demo.add_argument('--keep', action='store_true', help='keep the demo directory')
+    shard = commands.add_parser('shard', help='show which worker probes each target')
+    shard.add_argument('--workers', type=int, required=True)
+    shard.add_argument('--targets-file', default=os.getenv('TARGETS_FILE', 'targets.json'))
+    args = parser.parse_args()
+    if args.command == 'demo':
+        workdir = run_demo(args.locations, args.workers, args.seconds, args.interval)
+        if args.keep: print(f"Demo files kept in {workdir}")
+        else: shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        import check_status
+        targets = check_status.load_targets(args.targets_file) # Named exactly as the workers name them
+        for index in range(args.workers):
+            print(f"worker {index}: {', '.join(t['name'] for t in shard_targets(targets, index, args.workers)) or '-'}")
@@ -0,0 +1,281 @@
+# Append-only, segmented check log for Status Snitch.
+# Records are JSON lines in one segment per UTC hour (history/20260821T20.jsonl),
+# each with a sparse timestamp index (.idx) so range reads can seek instead of scan.
+# Closed segments are gzip-compacted and retention is by age and total size.
+
+import gzip
+import json
+import os
+import re
+import shutil
+from bisect import bisect_right
+from datetime import datetime, timezone, timedelta
+
+# === CONFIGURATION ===
+HISTORY_DIR = os.getenv('HISTORY_DIR', 'history')
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024 # Roll over to a new part within the hour past this size
+INDEX_STRIDE_BYTES = 64 * 1024 # Write an index entry at most once per this many bytes
+ORDER_SLACK_SECONDS = 120 # Records in a segment may be out of order by up to this much
+COMPACT_AFTER_HOURS = 2 # Gzip segments once they are this many hours old
+RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', 400))
+RETENTION_MAX_BYTES = int(os.getenv('HISTORY_RETENTION_MAX_BYTES', 512 * 1024 * 1024))
+TAIL_LOOKBACK_SEGMENTS = 72 # Newest segments scanned when rebuilding a per-target tail
+
+SEGMENT_RE = re.compile(r'^(\d{8}T\d{2})(?:\.(\d+))?\.jsonl(\.gz)?$')
+SEGMENT_TIME_FORMAT = '%Y%m%dT%H'
+
+_index_cursors = {} # segment path -> byte offset of its last index entry
+_writable_segments = {} # (directory, hour_key) -> segment path being appended to
+MAX_WRITABLE_CACHE = 64
+
+# === HELPER FUNCTIONS ===
+
+def parse_timestamp(ts_str):
+    """Parses a stored UTC ISO timestamp ('...Z') into epoch seconds."""
+    return datetime.fromisoformat(ts_str.replace('Z', '+00:00')).replace(tzinfo=timezone.utc).timestamp()
+
+def segment_hour(ts_epoch):
+    """Returns the segment key (UTC hour) for an epoch timestamp."""
+    return datetime.fromtimestamp(ts_epoch, timezone.utc).strftime(SEGMENT_TIME_FORMAT)
+
+def list_segments(directory):
+    """Lists segments as (hour_key, part, path), oldest first."""
+    if not os.path.isdir(directory): return []
+    segments = []
+    for entry in os.listdir(directory):
+        match = SEGMENT_RE.match(entry)
+        if match:
+            segments.append((match.group(1), int(match.group(2) or 0), os.path.join(directory, entry)))
+    segments.sort()
+    return segments
+
+def _index_path(segment_path):
+    return re.sub(r'\.jsonl(\.gz)?$', '.idx', segment_path)
+
+def _open_segment(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+def _last_index_offset(segment_path):
+    """Byte offset of the segment's last index entry (-1 if it has none), cached per process."""
+    if segment_path in _index_cursors: return _index_cursors[segment_path]
+    offset = -1
+    try:
+        with open(_index_path(segment_path), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64))
+            lines = f.read().splitlines()
+            if lines: offset = int(lines[-1].split()[1])
+    except (IOError, ValueError, IndexError):
+        pass
+    _index_cursors[segment_path] = offset
+    return offset
+
+def _writable_segment(directory, hour_key):
+    """Returns the path new records for this hour should be appended to.
+
+    The path is cached per hour, so an append costs one stat of that file;
+    the directory is only listed the first time an hour is written to.
+    """
+    key = (directory, hour_key)
+    path = _writable_segments.get(key)
+    try:
+        if path is not None and os.path.getsize(path) < SEGMENT_MAX_BYTES: return path
+    except OSError:
+        path = None # Compacted or pruned underneath us
+    if path is not None:
+        # The cached part is full: roll over to the next one
+        path = os.path.join(directory, f"{hour_key}.{int(SEGMENT_RE.match(os.path.basename(path)).group(2) or 0) + 1}.jsonl")
+    else:
+        parts = [s for s in list_segments(directory) if s[0] == hour_key]
+        if not parts: path = os.path.join(directory, f"{hour_key}.jsonl")
+        else:
+            _, part, path = parts[-1]
+            if path.endswith('.gz') or os.path.getsize(path) >= SEGMENT_MAX_BYTES:
+                path = os.path.join(directory, f"{hour_key}.{part + 1}.jsonl")
+    if len(_writable_segments) >= MAX_WRITABLE_CACHE: _writable_segments.clear()
+    _writable_segments[key] = path
+    return path
+
+def append_records(directory, records):
+    """Appends check records (each carrying a 'target' key) to their hourly segments. O(1) per record."""
+    if not records: return
+    os.makedirs(directory, exist_ok=True)
+    by_segment = {}
+    for record in records:
+        ts_epoch = parse_timestamp(record['timestamp'])
+        by_segment.setdefault(segment_hour(ts_epoch), []).append((ts_epoch, record))
+    for hour_key, entries in sorted(by_segment.items()):
+        path = _writable_segment(directory, hour_key)
+        last_indexed = _last_index_offset(path)
+        index_lines = []
+        with open(path, 'ab') as f:
+            for ts_epoch, record in entries:
+                offset = f.tell()
+                if last_indexed < 0 or offset - last_indexed >= INDEX_STRIDE_BYTES:
+                    index_lines.append(f"{ts_epoch:.3f} {offset}\n")
+                    last_indexed = offset
+                f.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+        if index_lines:
+            with open(_index_path(path), 'a') as f:
+                f.writelines(index_lines)
+        _index_cursors[path] = last_indexed
+
+def _load_index(segment_path):
+    timestamps, offsets = [], []
+    try:
+        with open(_index_path(segment_path), 'r') as f:
+            for line in f:
+                ts, offset = line.split()
+                timestamps.append(float(ts)); offsets.append(int(offset))
+    except (IOError, ValueError):
+        return [], []
+    return timestamps, offsets
+
+def _seek_offset(segment_path, since_epoch):
+    """Offset to start reading a segment from so that no record at or after since_epoch is missed."""
+    timestamps, offsets = _load_index(segment_path)
+    position = bisect_right(timestamps, since_epoch - ORDER_SLACK_SECONDS) - 1
+    return offsets[position] if position >= 0 else 0
+
+def _iter_segment(path, since_epoch=None):
+    with _open_segment(path) as f:
+        if since_epoch is not None: f.seek(_seek_offset(path, since_epoch))
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue # Torn write at the tail of a crashed append
+
+def segment_records(path):
+    """Every complete record of one segment file (gzipped or not), in file order."""
+    return _iter_segment(path)
+
+def read_history(directory, since=None, until=None, target=None, limit=None):
+    """Reads records in [since, until] (ISO strings or epoch seconds), oldest segment first.
+
+    Only segments overlapping the range are opened, and each is entered at the
+    nearest index entry rather than parsed from the top.
+    """
+    since_epoch = parse_timestamp(since) if isinstance(since, str) else since
+    until_epoch = parse_timestamp(until) if isinstance(until, str) else until
+    first_key = segment_hour(since_epoch - ORDER_SLACK_SECONDS) if since_epoch is not None else None
+    last_key = segment_hour(until_epoch + ORDER_SLACK_SECONDS) if until_epoch is not None else None
+    results = []
+    for hour_key, _, path in list_segments(directory):
+        if first_key and hour_key < first_key: continue
+        if last_key and hour_key > last_key: break
+        for record in _iter_segment(path, since_epoch):
+            if target is not None and record.get('target') != target: continue
+            try:
+                ts_epoch = parse_timestamp(record['timestamp'])
+            except (KeyError, ValueError, AttributeError):
+                continue
+            if since_epoch is not None and ts_epoch < since_epoch: continue
+            if until_epoch is not None and ts_epoch > until_epoch: continue
+            results.append(record)
+            if limit is not None and len(results) >= limit: return results
+    return results
+
+def iter_positions(directory, after=None):
+    """Yields (position, record) for every complete record after `after`, in log order.
+
+    A position is (hour_key, part, end_offset) and orders like the log itself,
+    so it can serve as a resumable cursor (e.g. an SSE event id). Records whose
+    line is still being written are left for the next call.
+    """
+    for hour_key, part, path in list_segments(directory):
+        if after is not None and (hour_key, part) < after[:2]: continue
+        offset = after[2] if after is not None and (hour_key, part) == after[:2] else 0
+        try:
+            with _open_segment(path) as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'): break # Partial append; pick it up next time
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    yield (hour_key, part, offset), record
+        except (IOError, EOFError):
+            continue # Segment compacted or pruned underneath us
+
+def end_position(directory):
+    """Position just past the newest complete record, for cursors that only want new records."""
+    position = None
+    segments = list_segments(directory)
+    if segments and not segments[-1][2].endswith('.gz'):
+        hour_key, part, path = segments[-1]
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(0, size - 65536)
+            f.seek(start)
+            tail = f.read()
+        position = (hour_key, part, start + tail.rfind(b'\n') + 1)
+    elif segments:
+        for position, _ in iter_positions(directory, segments[-1][:2] + (0,)): pass
+    return position
+
+def tail_history(directory, count, targets=None):
+    """Returns the newest `count` records per target, oldest first, scanning newest segments only."""
+    wanted = set(targets) if targets is not None else None
+    tails = {}
+    for _, _, path in reversed(list_segments(directory)[-TAIL_LOOKBACK_SEGMENTS:]):
+        segment_records = list(_iter_segment(path))
+        for record in reversed(segment_records):
+            name = record.get('target')
+            if wanted is not None and name not in wanted: continue
+            bucket = tails.setdefault(name, [])
+            if len(bucket) < count: bucket.append(record)
+        if wanted is not None and all(len(tails.get(n, [])) >= count for n in wanted): break
+    for name, bucket in tails.items():
+        bucket.reverse()
+        bucket.sort(key=lambda r: r.get('timestamp', '')) # Stable: fixes cross-sweep disorder only
+    return tails
+
+def compact_segments(directory, now=None):
+    """Gzips segments that are no longer being appended to. Their indexes stay valid (uncompressed offsets)."""
+    now = now or datetime.now(timezone.utc)
+    cutoff_key = (now - timedelta(hours=COMPACT_AFTER_HOURS)).strftime(SEGMENT_TIME_FORMAT)
+    compacted = 0
+    for hour_key, _, path in list_segments(directory):
+        if hour_key >= cutoff_key or path.endswith('.gz'): continue
+        try:
+            with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+            _index_cursors.pop(path, None)
+            compacted += 1
+        except IOError as e:
+            print(f"Error compacting history segment '{path}': {e}")
+    if compacted: print(f"Compacted {compacted} history segment(s)")
+    return compacted
+
+def prune_history(directory, now=None, max_age_days=RETENTION_DAYS, max_total_bytes=RETENTION_MAX_BYTES):
+    """Drops whole segments older than the retention age, then oldest-first until under the size cap."""
+    now = now or datetime.now(timezone.utc)
+    cutoff_key = (now - timedelta(days=max_age_days)).strftime(SEGMENT_TIME_FORMAT)
+    segments = list_segments(directory)
+    sizes = {path: os.path.getsize(path) for _, _, path in segments}
+    total_bytes = sum(sizes.values())
+    removed = 0
+    for position, (hour_key, _, path) in enumerate(segments):
+        is_newest = position == len(segments) - 1
+        if is_newest or (hour_key >= cutoff_key and total_bytes <= max_total_bytes): break
+        try:
+            os.remove(path)
+            if os.path.exists(_index_path(path)): os.remove(_index_path(path))
+        except IOError as e:
+            print(f"Error pruning history segment '{path}': {e}")
+            continue
+        _index_cursors.pop(path, None)
+        total_bytes -= sizes[path]
+        removed += 1
+    if removed: print(f"Pruned {removed} history segment(s) past retention")
+    return removed
+
+def maintain_history(directory, now=None):
+    """Runs compaction and retention; cheap enough to call after every sweep."""
+    compact_segments(directory, now)
+    prune_history(directory, now)
@@ -0,0 +1,117 @@
+# Load test for api.py: requests/sec for /status before and after caching.
+# "before" replays the original handler (open + json.load + jsonify on every
+# request); "after" is the cached /status, both plain and with If-None-Match.
+# Usage: python loadtest_api.py [--seconds 5] [--clients 8] [--state status.json | --synthetic-targets 200]
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import requests
+from flask import jsonify
+from werkzeug.serving import WSGIRequestHandler, make_server
+import api
+import sketch
+
+# === HELPER FUNCTIONS ===
+
+@api.app.route('/status-uncached')
+def status_uncached():
+    """The pre-cache /status handler, kept here only as the load test baseline."""
+    try:
+        with open(api.STATE_FILE, 'r') as f:
+            data = json.load(f)
+    except Exception:
+        data = {}
+    return jsonify(data)
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass # Per-request access logs would dominate the measurement
+
+def serve_in_background():
+    """Starts the API on a free local port with a threaded server. Returns (server, base_url)."""
+    server = make_server('127.0.0.1', 0, api.app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, name='api-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def write_synthetic_state(path, target_count):
+    """Writes a hot state file for `target_count` targets, each with realistic latency sketches."""
+    targets = {}
+    for index in range(target_count):
+        latencies = sketch.new_sketch()
+        for _ in range(2000): sketch.add(latencies, random.lognormvariate(-1.2, 0.5))
+        targets[f"target-{index:03d}"] = {
+            'url': f"https://host{index % 20}.example.com/path/{index}", 'status': 'UP', 'response_time': 0.31,
+            'extra_info': None, 'stable_count': 1200, 'degraded_count': 0, 'alert_mode': False,
+            'last_check_timestamp_utc': '2026-08-22T20:35:34.623235Z', 'recent_response_times': [0.32, 0.40, 0.33],
+            'latency_sketch': latencies,
+        }
+    with open(path, 'w') as f:
+        json.dump({'targets': targets, 'last_check_timestamp_utc': '2026-08-22T20:35:34.623235Z'}, f, indent=2)
+
+def hammer(url, seconds, clients, headers=None):
+    """Issues GETs from `clients` keep-alive sessions for `seconds`. Returns (requests/sec, bytes/request)."""
+    counts, sizes, errors = [0] * clients, [0] * clients, []
+    deadline = time.perf_counter() + seconds
+
+    def client(slot):
+        session = requests.Session()
+        try:
+            while time.perf_counter() < deadline:
+                response = session.get(url, headers={'Accept-Encoding': 'identity', **(headers or {})}, timeout=10)
+                if response.status_code not in (200, 304): errors.append(response.status_code)
+                counts[slot] += 1
+                sizes[slot] += int(response.headers.get('Content-Length') or len(response.content)) # On-the-wire size
+        except requests.RequestException as e:
+            errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=client, args=(slot,)) for slot in range(clients)]
+    started = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    total = sum(counts)
+    if errors: print(f"  {len(errors)} error(s), e.g. {errors[0]}")
+    return total / elapsed, (sum(sizes) / total if total else 0)
+
+def run_load_test(seconds, clients):
+    """Runs the before/after scenarios and returns {scenario: {'rps', 'bytes_per_request'}}."""
+    server, base_url = serve_in_background()
+    try:
+        etag = requests.get(f"{base_url}/status").headers.get('ETag')
+        scenarios = {
+            'before: /status (parse every request)': (f"{base_url}/status-uncached", None),
+            'after: /status (cached)': (f"{base_url}/status", None),
+            'after: /status (cached, gzip)': (f"{base_url}/status", {'Accept-Encoding': 'gzip'}),
+            'after: /status (If-None-Match -> 304)': (f"{base_url}/status", {'If-None-Match': etag or ''}),
+            'after: /summary (cached)': (f"{base_url}/summary", None),
+        }
+        results = {}
+        for name, (url, headers) in scenarios.items():
+            rps, size = hammer(url, seconds, clients, headers)
+            results[name] = {'rps': round(rps, 1), 'bytes_per_request': round(size)}
+            print(f"{name:<42} {rps:9.1f} req/s  {size:9.0f} B/req")
+        return results
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure api.py throughput before and after caching.')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each scenario')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent keep-alive clients')
+    parser.add_argument('--state', help='state file to serve (defaults to STATE_FILE)')
+    parser.add_argument('--synthetic-targets', type=int, help='serve a generated state file with this many targets')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    if args.state: api.STATE_FILE = args.state
+    if args.synthetic_targets:
+        api.STATE_FILE = os.path.join(tempfile.mkdtemp(prefix='snitch-load-'), 'status.json')
+        write_synthetic_state(api.STATE_FILE, args.synthetic_targets)
+        print(f"Serving synthetic state: {args.synthetic_targets} targets, {os.path.getsize(api.STATE_FILE)} bytes")
+    results = run_load_test(args.seconds, args.clients)
+    if args.json: print(json.dumps(results, indent=2))
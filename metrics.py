@@ -0,0 +1,184 @@
+# Self-monitoring metrics for Status Snitch.
+# A small in-process registry of counters, gauges and histograms, rendered in
+# the OpenMetrics (or classic Prometheus) text format for scraping: api.py
+# serves /metrics, the --daemon checker can serve it on METRICS_PORT, and a
+# one-shot run can write it to METRICS_FILE for a textfile collector.
+# Disabled by default; every instrumentation call then returns immediately.
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === CONFIGURATION ===
+ENABLED = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108)) # Daemon-mode /metrics listener
+METRICS_FILE = os.getenv('METRICS_FILE') # One-shot runs write the exposition here when set
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 15.0, 30.0)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name -> (type, help, buckets). Counters are named without the _total suffix.
+METRIC_DEFINITIONS = {
+    'snitch_probe_duration_seconds': ('histogram', 'Load time of successful probes, by target.', LATENCY_BUCKETS),
+    'snitch_checks': ('counter', 'Checks recorded, by target and resulting status.', None),
+    'snitch_target_status': ('gauge', 'Current status of each target (1 for its status, 0 for the others).', None),
+    'snitch_target_response_seconds': ('gauge', 'Load time of the latest check of each target.', None),
+    'snitch_alert_queue_depth': ('gauge', 'Alerts waiting in the outbox for delivery.', None),
+    'snitch_sweep_duration_seconds': ('histogram', 'Time to probe every target in a one-shot run.', LATENCY_BUCKETS),
+    'snitch_state_load_duration_seconds': ('histogram', 'Time to load the hot state, log tails and rollups.', DURATION_BUCKETS),
+    'snitch_state_save_duration_seconds': ('histogram', 'Time to save the hot state and rollups.', DURATION_BUCKETS),
+    'snitch_html_render_duration_seconds': ('histogram', 'Time to render the dashboard and publish its data shards.', DURATION_BUCKETS),
+    'snitch_api_request_duration_seconds': ('histogram', 'API request handling time, by endpoint and status code.', DURATION_BUCKETS),
+}
+STATUSES = ('UP', 'SLOW', 'DEGRADED', 'ERROR', 'DOWN', 'UNKNOWN')
+
+_values = {} # (name, labels) -> float, or [bucket counts, sum, count] for histograms
+_collectors = [] # callables returning [(name, labels dict, value)] at scrape time
+_lock = threading.Lock()
+
+# === INSTRUMENTATION ===
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+def reset():
+    with _lock:
+        _values.clear()
+        _collectors.clear()
+
+def _key(name, labels):
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ())
+
+def inc(name, value=1.0, **labels):
+    if not ENABLED: return
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0.0) + value
+
+def set_gauge(name, value, **labels):
+    if not ENABLED: return
+    with _lock:
+        _values[_key(name, labels)] = float(value)
+
+def observe(name, value, **labels):
+    if not ENABLED: return
+    buckets = METRIC_DEFINITIONS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        entry = _values.get(key)
+        if entry is None: entry = _values[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(buckets, value)] += 1 # Per-bucket counts; made cumulative when rendered
+        entry[1] += value
+        entry[2] += 1
+
+def timed(name, **labels):
+    """Decorator recording the call's duration into histogram `name` (a flag check when disabled)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED: return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, **labels)
+        return wrapper
+    return decorate
+
+def set_status(target, status):
+    """One-hot status gauge for a target."""
+    if not ENABLED: return
+    keys = [(_key('snitch_target_status', {'target': target, 'status': candidate}), candidate == status) for candidate in STATUSES]
+    with _lock:
+        for key, current in keys: _values[key] = 1.0 if current else 0.0
+
+def register_collector(collect):
+    """Adds a callable evaluated at scrape time, returning [(gauge name, labels dict, value)]."""
+    with _lock:
+        _collectors.append(collect)
+
+# === EXPOSITION ===
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs: return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render(openmetrics=True):
+    """The registry as exposition text: OpenMetrics 1.0, or the classic Prometheus 0.0.4 format."""
+    with _lock:
+        values = dict(_values)
+        collectors = list(_collectors)
+        histograms = {key: (list(v[0]), v[1], v[2]) for key, v in values.items() if isinstance(v, list)}
+    for collect in collectors:
+        try:
+            for name, labels, value in collect(): values[_key(name, labels)] = float(value)
+        except Exception as e: # A failing collector must not break the scrape
+            print(f"Metrics collector failed: {e}")
+    by_name = {}
+    for (name, labels), value in sorted(values.items()):
+        by_name.setdefault(name, []).append((labels, histograms.get((name, labels), value)))
+    lines = []
+    for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+        samples = by_name.get(name)
+        if not samples: continue
+        family = name if kind != 'counter' or openmetrics else f"{name}_total"
+        lines.append(f"# TYPE {family} {kind}")
+        lines.append(f"# HELP {family} {help_text}")
+        for labels, value in samples:
+            if kind == 'histogram':
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            else:
+                lines.append(f"{name}{'_total' if kind == 'counter' else ''}{_format_labels(labels)} {_format_value(value)}")
+    if openmetrics: lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+def wants_openmetrics(accept_header):
+    return 'application/openmetrics-text' in (accept_header or '')
+
+def write_textfile(filename):
+    """Writes the exposition for a node_exporter textfile collector (Prometheus format, atomically)."""
+    try:
+        with open(filename + '.tmp', 'w') as f:
+            f.write(render(openmetrics=False))
+        os.replace(filename + '.tmp', filename)
+    except IOError as e:
+        print(f"Error writing metrics file '{filename}': {e}")
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        openmetrics = wants_openmetrics(self.headers.get('Accept'))
+        body = render(openmetrics).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every few seconds would drown the checker's own log
+
+def start_http_server(port=METRICS_PORT, host='0.0.0.0'):
+    """Serves /metrics from a background thread (for the daemon). Returns the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,156 @@
+# Instrumented HTTP(S) probe for Status Snitch.
+# Performs the request by hand (getaddrinfo, socket connect, TLS handshake,
+# http.client exchange) so each phase can be timed separately with a
+# monotonic clock: DNS, TCP connect, TLS, time to first byte, body transfer.
+
+import http.client
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+# === CONFIGURATION ===
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'body')
+MAX_REDIRECTS = 5
+READ_CHUNK_BYTES = 64 * 1024
+USER_AGENT = 'StatusSnitch/1.0'
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+_idle_connections = {} # (scheme, host, port, verify) -> [http.client connection] kept alive between probes
+_idle_connections_lock = threading.Lock()
+
+# === HELPER FUNCTIONS ===
+
+def _take_idle(key):
+    with _idle_connections_lock:
+        pool = _idle_connections.get(key)
+        return pool.pop() if pool else None
+
+def _give_back(key, conn):
+    with _idle_connections_lock:
+        _idle_connections.setdefault(key, []).append(conn)
+
+def close_idle_connections():
+    """Closes every kept-alive connection (used on shutdown)."""
+    with _idle_connections_lock:
+        pools = list(_idle_connections.values())
+        _idle_connections.clear()
+    for pool in pools:
+        for conn in pool: conn.close()
+
+def tls_context(verify):
+    """TLS context for `verify`: True (system CAs), a CA bundle path, or False (no verification)."""
+    if isinstance(verify, str): return ssl.create_default_context(cafile=verify)
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+def _open_connection(scheme, host, port, timeout, verify, phases):
+    """Resolves, connects and (for https) handshakes, timing each step into `phases`."""
+    started = time.perf_counter()
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    resolved = time.perf_counter()
+    phases['dns'] += resolved - started
+    family, socktype, proto, _, address = infos[0]
+    sock = socket.socket(family, socktype, proto)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        connected = time.perf_counter()
+        phases['connect'] += connected - resolved
+        if scheme == 'https':
+            context = tls_context(verify)
+            sock = context.wrap_socket(sock, server_hostname=host)
+            phases['tls'] += time.perf_counter() - connected
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    except BaseException:
+        sock.close()
+        raise
+    conn.sock = sock
+    return conn
+
+def _exchange(conn, path, host_header, phases, max_body_bytes, on_chunk=None):
+    """Sends the GET and reads the body, timing TTFB (through response headers) and body transfer.
+
+    A final (non-redirect) response's chunks are passed to `on_chunk`; once it
+    returns True the rest of the body is left unread. Returns (response, body, size, stopped_early).
+    """
+    sent = time.perf_counter()
+    conn.request('GET', path, headers={'Host': host_header, 'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'})
+    response = conn.getresponse()
+    first_byte = time.perf_counter()
+    phases['ttfb'] += first_byte - sent
+    if response.status in REDIRECT_CODES: on_chunk = None
+    chunks, size, stopped_early = [], 0, False
+    while True:
+        chunk = response.read(READ_CHUNK_BYTES)
+        if not chunk: break
+        size += len(chunk)
+        if max_body_bytes is None or size <= max_body_bytes: chunks.append(chunk)
+        if on_chunk is not None and on_chunk(chunk):
+            stopped_early = True
+            break
+    phases['body'] += time.perf_counter() - first_byte
+    return response, b''.join(chunks), size, stopped_early
+
+def timed_get(url, timeout, verify=True, max_redirects=MAX_REDIRECTS, max_body_bytes=None, on_chunk=None):
+    """GETs a URL (following redirects), returning phase timings alongside the response.
+
+    Returns a dict with status_code, body, bytes, reused, redirects, final_url,
+    total (seconds), phases (seconds per phase, summed over redirect hops) and
+    stopped_early (`on_chunk` ended the read; that connection is not kept alive).
+    Network failures propagate as OSError / http.client.HTTPException.
+    """
+    phases = dict.fromkeys(PHASES, 0.0)
+    started = time.perf_counter()
+    reused_any = False
+    size = 0
+    for redirects in range(max_redirects + 1):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        host = parts.hostname
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, host, port, verify if scheme == 'https' else None) # An unverified TLS connection never serves a verifying target
+        host_header = host if parts.port is None else f"{host}:{port}"
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        conn = _take_idle(key)
+        reused = conn is not None
+        try:
+            if conn is None: conn = _open_connection(scheme, host, port, timeout, verify, phases)
+            try:
+                response, body, hop_size, stopped_early = _exchange(conn, path, host_header, phases, max_body_bytes, on_chunk)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused: raise
+                # The server closed the idle connection; retry once on a fresh one
+                conn.close()
+                reused = False
+                conn = _open_connection(scheme, host, port, timeout, verify, phases)
+                response, body, hop_size, stopped_early = _exchange(conn, path, host_header, phases, max_body_bytes, on_chunk)
+        except BaseException:
+            if conn is not None: conn.close()
+            raise
+        reused_any = reused_any or reused
+        size += hop_size
+        if response.will_close or stopped_early: conn.close() # An unread body leaves the connection unusable
+        else: _give_back(key, conn)
+        location = response.getheader('Location')
+        if response.status in REDIRECT_CODES and location and redirects < max_redirects:
+            url = urljoin(url, location)
+            continue
+        break
+    return {
+        'status_code': response.status,
+        'body': body,
+        'bytes': size,
+        'reused': reused_any,
+        'redirects': redirects,
+        'final_url': url,
+        'total': time.perf_counter() - started,
+        'phases': phases,
+        'stopped_early': stopped_early,
+    }
@@ -0,0 +1,172 @@
+# Incrementally maintained rollup tiers for Status Snitch.
+# Each check updates one bucket per tier (minute/hour/day/week) with status counts
+# and latency sum/min/max, so uptime and latency over 24h..90d windows are read
+# from a bounded number of buckets instead of re-parsing raw history.
+# Buckets with latencies also carry a mergeable sketch for p50/p95/p99, on the
+# tiers that percentile windows read (week buckets and old day buckets drop theirs).
+# Each target's rollups are a file of their own under ROLLUPS_DIR, and a save
+# only rewrites targets that recorded checks since the last one.
+
+import json
+import os
+import data_shards
+import sketch
+
+# === CONFIGURATION ===
+ROLLUPS_DIR = os.getenv('ROLLUPS_DIR', 'rollup_data')
+LEGACY_ROLLUPS_FILE = 'rollups.json' # Single-file layout, migrated into ROLLUPS_DIR once
+WEEK_ALIGN_SECONDS = 4 * 86400 # 1970-01-05 was a Monday; weeks start Monday 00:00 UTC
+TIERS = {
+    # tier: (bucket span in seconds, buckets retained)
+    'minute': (60, 180),
+    'hour': (3600, 24 * 8),
+    'day': (86400, 400),
+    'week': (7 * 86400, 104),
+}
+WINDOWS = {'24h': 86400, '7d': 7 * 86400, '30d': 30 * 86400, '90d': 90 * 86400}
+SKETCH_BUCKETS = {'minute': 180, 'hour': 24 * 8, 'day': 91} # Newest buckets per tier that keep a sketch (covers the 90d window)
+UP_STATUSES = ('UP', 'SLOW', 'DEGRADED') # Reachable and serving, however slowly
+
+_dirty = set() # Targets with checks recorded since their file was last written
+
+# === HELPER FUNCTIONS ===
+
+def bucket_start(tier, ts_epoch):
+    """Start (epoch seconds) of the tier bucket containing ts_epoch."""
+    span = TIERS[tier][0]
+    offset = WEEK_ALIGN_SECONDS if tier == 'week' else 0
+    return int((ts_epoch - offset) // span * span + offset)
+
+def new_bucket():
+    return {'count': 0, 'lat_count': 0, 'lat_sum': 0.0, 'lat_min': None, 'lat_max': None}
+
+def add_to_bucket(bucket, status, latency, with_sketch=True):
+    """Adds one check to a bucket. `latency` is None when the check has no valid load time."""
+    bucket['count'] += 1
+    key = status.lower()
+    bucket[key] = bucket.get(key, 0) + 1
+    if latency is not None:
+        bucket['lat_count'] += 1
+        bucket['lat_sum'] += latency
+        bucket['lat_min'] = latency if bucket['lat_min'] is None else min(bucket['lat_min'], latency)
+        bucket['lat_max'] = latency if bucket['lat_max'] is None else max(bucket['lat_max'], latency)
+        if with_sketch: sketch.add(bucket.setdefault('sketch', sketch.new_sketch()), latency)
+
+def merge_buckets(buckets):
+    """Combines buckets into one aggregate bucket. It has a sketch only if every bucket with latencies had one."""
+    total = new_bucket()
+    sketched = True
+    for bucket in buckets:
+        if bucket.get('lat_count') and 'sketch' not in bucket: sketched = False
+        for key, value in bucket.items():
+            if key == 'sketch':
+                sketch.merge(total.setdefault('sketch', sketch.new_sketch()), value)
+            elif key == 'lat_min':
+                if value is not None: total[key] = value if total[key] is None else min(total[key], value)
+            elif key == 'lat_max':
+                if value is not None: total[key] = value if total[key] is None else max(total[key], value)
+            elif isinstance(value, (int, float)):
+                total[key] = total.get(key, 0) + value
+    if not sketched: total.pop('sketch', None) # Percentiles over part of the window would mislead
+    return total
+
+def record_check(target_rollups, ts_epoch, status, latency):
+    """Updates every tier for one check in O(1) and evicts buckets past each tier's retention."""
+    for tier, (_, max_buckets) in TIERS.items():
+        buckets = target_rollups.setdefault(tier, {})
+        key = str(bucket_start(tier, ts_epoch))
+        bucket = buckets.get(key)
+        sketch_buckets = SKETCH_BUCKETS.get(tier, 0)
+        if bucket is None:
+            bucket = buckets[key] = new_bucket()
+            while len(buckets) > max_buckets:
+                del buckets[min(buckets, key=int)]
+            if sketch_buckets and len(buckets) > sketch_buckets:
+                for start in sorted(buckets, key=int)[:-sketch_buckets]: buckets[start].pop('sketch', None)
+        add_to_bucket(bucket, status, latency, with_sketch=sketch_buckets > 0)
+
+def window_buckets(target_rollups, window_seconds, now_epoch):
+    """Buckets overlapping the trailing window, from the finest tier that retains all of it."""
+    for tier, (span, max_buckets) in TIERS.items():
+        if span * max_buckets >= window_seconds or tier == 'week':
+            cutoff = now_epoch - window_seconds
+            return [b for start, b in target_rollups.get(tier, {}).items() if int(start) + span > cutoff]
+    return []
+
+def summarize(bucket):
+    """Derives display figures (uptime %, avg/min/max latency, percentiles) from an aggregate bucket."""
+    count = bucket.get('count', 0)
+    up_count = sum(bucket.get(s.lower(), 0) for s in UP_STATUSES)
+    lat_count = bucket.get('lat_count', 0)
+    return {
+        'count': count,
+        'uptime_percent': (up_count / count) * 100 if count else None,
+        'avg_latency': bucket['lat_sum'] / lat_count if lat_count else None,
+        'min_latency': bucket.get('lat_min'),
+        'max_latency': bucket.get('lat_max'),
+        **sketch.percentiles(bucket.get('sketch')),
+    }
+
+def query_window(target_rollups, window_seconds, now_epoch):
+    """Uptime and latency summary for a trailing window, without touching raw records."""
+    return summarize(merge_buckets(window_buckets(target_rollups, window_seconds, now_epoch)))
+
+def rollup_path(directory, name):
+    return os.path.join(directory, data_shards.target_slug(name) + '.json')
+
+def load_target_rollups(directory, name):
+    """One target's rollups, or {} when it has none yet."""
+    try:
+        with open(rollup_path(directory, name), 'r') as f:
+            stored = json.load(f)
+        return stored['rollups'] if isinstance(stored.get('rollups'), dict) else {}
+    except (IOError, json.JSONDecodeError, AttributeError, KeyError):
+        return {}
+
+def load_rollups(directory):
+    """Loads rollups keyed by target; returns None when there are none so callers can rebuild.
+
+    A single-file rollups.json next to the directory (an older install) is
+    loaded instead, and saved per target on the next save.
+    """
+    if not os.path.isdir(directory):
+        legacy_file = os.path.join(os.path.dirname(directory), LEGACY_ROLLUPS_FILE)
+        if os.path.exists(legacy_file):
+            try:
+                with open(legacy_file, 'r') as f:
+                    legacy = json.load(f)
+                print(f"Migrating rollups from {legacy_file} into {directory}/")
+                return legacy if isinstance(legacy, dict) else {} # No files yet, so the next save writes every target
+            except (IOError, json.JSONDecodeError) as e:
+                print(f"Rollups file '{legacy_file}' invalid, starting fresh. Error: {e}")
+        return None
+    rollups = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'): continue
+        try:
+            with open(os.path.join(directory, filename), 'r') as f:
+                stored = json.load(f)
+            if isinstance(stored.get('rollups'), dict): rollups[str(stored['target'])] = stored['rollups']
+        except (IOError, json.JSONDecodeError, AttributeError, KeyError) as e:
+            print(f"Rollups file '{filename}' invalid, skipping it. Error: {e}")
+    return rollups
+
+def mark_dirty(name):
+    _dirty.add(name)
+
+def save_rollups(directory, rollups):
+    """Atomically writes the files of targets that changed since the last save (or have no file yet)."""
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for name, target_rollups in rollups.items():
+        path = rollup_path(directory, name)
+        if name not in _dirty and os.path.exists(path): continue
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump({'target': name, 'rollups': target_rollups}, f, separators=(',', ':'))
+            os.replace(path + '.tmp', path)
+            _dirty.discard(name)
+            written += 1
+        except IOError as e:
+            print(f"Error saving rollups file '{path}': {e}")
+    return written
@@ -0,0 +1,86 @@
+# Mergeable, bounded-memory latency sketch for Status Snitch.
+# A log-bucketed histogram (DDSketch-style): every value lands in bucket
+# ceil(log_gamma(v)), so quantiles carry at most RELATIVE_ACCURACY relative
+# error, and two sketches merge exactly by adding bucket counts.
+
+import math
+
+# === CONFIGURATION ===
+RELATIVE_ACCURACY = 0.01 # Quantile estimates are within 1% of the true value
+MIN_TRACKED_VALUE = 1e-4 # Seconds; smaller values are counted in the zero bucket
+MAX_BINS = 512 # Lowest bins are collapsed together past this many
+PERCENTILES = {'p50': 0.50, 'p95': 0.95, 'p99': 0.99}
+
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# === HELPER FUNCTIONS ===
+
+def new_sketch():
+    """Returns an empty sketch. Bin keys are strings so the sketch round-trips through JSON."""
+    return {'count': 0, 'zero': 0, 'min': None, 'max': None, 'bins': {}}
+
+def bin_index(value):
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+def bin_value(index):
+    """Representative value of a bin: the point with equal relative error to both edges."""
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+def _collapse(sketch):
+    """Merges the lowest bins until the sketch is back under MAX_BINS (low quantiles lose accuracy first)."""
+    bins = sketch['bins']
+    if len(bins) <= MAX_BINS: return
+    indexes = sorted(bins, key=int)
+    surplus = indexes[:len(indexes) - MAX_BINS + 1]
+    bins[surplus[-1]] = sum(bins.pop(i) for i in surplus[:-1]) + bins[surplus[-1]]
+
+def add(sketch, value, count=1):
+    """Records a latency (seconds). O(1) apart from the rare collapse."""
+    sketch['count'] += count
+    sketch['min'] = value if sketch['min'] is None else min(sketch['min'], value)
+    sketch['max'] = value if sketch['max'] is None else max(sketch['max'], value)
+    if value < MIN_TRACKED_VALUE:
+        sketch['zero'] += count
+        return
+    key = str(bin_index(value))
+    bins = sketch['bins']
+    bins[key] = bins.get(key, 0) + count
+    if len(bins) > MAX_BINS: _collapse(sketch)
+
+def merge(into, other):
+    """Adds `other` into `into` in place and returns it."""
+    if not other or not other.get('count'): return into
+    into['count'] += other['count']
+    into['zero'] += other.get('zero', 0)
+    for bound, pick in (('min', min), ('max', max)):
+        if other.get(bound) is not None:
+            into[bound] = other[bound] if into[bound] is None else pick(into[bound], other[bound])
+    bins = into['bins']
+    for key, count in other.get('bins', {}).items():
+        bins[key] = bins.get(key, 0) + count
+    _collapse(into)
+    return into
+
+def merged(sketches):
+    """Returns a new sketch combining any number of sketches."""
+    total = new_sketch()
+    for sketch in sketches:
+        merge(total, sketch)
+    return total
+
+def quantile(sketch, q):
+    """Estimated value at quantile q (0..1), or None for an empty sketch."""
+    if not sketch or not sketch.get('count'): return None
+    rank = q * (sketch['count'] - 1)
+    seen = sketch.get('zero', 0)
+    if rank < seen: return sketch['min']
+    for key in sorted(sketch['bins'], key=int):
+        seen += sketch['bins'][key]
+        if rank < seen:
+            return min(max(bin_value(int(key)), sketch['min']), sketch['max'])
+    return sketch['max']
+
+def percentiles(sketch):
+    """The configured PERCENTILES (p50/p95/p99) for a sketch; values are None when it is empty."""
+    return {label: quantile(sketch, q) for label, q in PERCENTILES.items()}
@@ -0,0 +1,104 @@
+# Local stand-in HTTP/HTTPS server for exercising Status Snitch without the internet.
+# Response behaviour is driven by query parameters, e.g.
+#   /?delay=0.3&bytes=50000&status=503&keyword=SimplePractice
+# and POSTs (e.g. webhook deliveries) are logged and answered with `status`.
+# Usage: python stub_server.py [--port 8080] [--certfile cert.pem --keyfile key.pem]
+
+import argparse
+import json
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# === CONFIGURATION ===
+DEFAULT_PORT = 8080
+MAX_STUB_BYTES = 64 * 1024 * 1024
+
+# === REQUEST HANDLER ===
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so connection reuse can be observed
+    disable_nagle_algorithm = True # Headers and body go out as separate writes
+    received_posts = [] # Bodies of POST requests, for webhook stand-in checks
+    received_lock = threading.Lock()
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass # Client stopped reading early (e.g. an assertion was decided)
+
+    def _params(self):
+        query = parse_qs(urlsplit(self.path).query)
+        return {key: values[-1] for key, values in query.items()}
+
+    def do_GET(self):
+        params = self._params()
+        time.sleep(float(params.get('delay', 0)))
+        status = int(params.get('status', 200))
+        if 'redirect' in params:
+            self.send_response(302)
+            self.send_header('Location', params['redirect'])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if params.get('json'):
+            body = params['json'].encode('utf-8')
+            content_type = 'application/json'
+        else:
+            size = min(int(params.get('bytes', 512)), MAX_STUB_BYTES)
+            keyword = params.get('keyword', 'SimplePractice')
+            filler = b'x' * max(0, size - len(keyword))
+            body = filler[:len(filler) // 2] + keyword.encode('utf-8') + filler[len(filler) // 2:]
+            content_type = 'text/html; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        params = self._params()
+        time.sleep(float(params.get('delay', 0)))
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        with self.received_lock:
+            self.received_posts.append({'path': self.path, 'body': body.decode('utf-8', 'replace'), 'received_at': time.time()})
+        status = int(params.get('status', 200))
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark and probe output clean
+
+def start_stub_server(port=0, certfile=None, keyfile=None):
+    """Starts the stub server on a background thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, name='stub-server', daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in target / webhook server.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--certfile', help='PEM certificate; serves HTTPS when given')
+    parser.add_argument('--keyfile', help='PEM private key for --certfile')
+    args = parser.parse_args()
+    server, base_url = start_stub_server(args.port, args.certfile, args.keyfile)
+    print(f"Stub server listening on {base_url}")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps({'posts_received': len(StubHandler.received_posts)}))
+        server.shutdown()
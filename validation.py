@@ -0,0 +1,176 @@
+# Streaming response validation for Status Snitch.
+# A target's assertions are evaluated chunk by chunk as the body arrives, so
+# the download stops as soon as every assertion is decided (or one has failed),
+# and never reads more than a byte cap. Supported assertions:
+#   {"type": "contains", "value": "SimplePractice"}       substring, found across chunk boundaries
+#   {"type": "regex", "pattern": "v\\d+\\.\\d+", "window": 4096}   matches up to `window` bytes long
+#   {"type": "min_bytes", "value": 1000} / {"type": "max_bytes", "value": 5000000}
+#   {"type": "hash"} or {"type": "hash", "expect": "unchanged"}   content hash change detection
+#   {"type": "json", "path": "status.indicator", "equals": "none"}   (or "exists": true)
+# "contains" and "regex" accept "absent": true to require that the text never appears.
+
+import hashlib
+import json
+import re
+import time
+
+# === CONFIGURATION ===
+MAX_READ_BYTES = 5 * 1024 * 1024 # Default cap on bytes read while validating
+CHUNK_BYTES = 16 * 1024
+DEFAULT_REGEX_WINDOW = 4096
+ASSERTION_TYPES = ('contains', 'regex', 'min_bytes', 'max_bytes', 'hash', 'json')
+FULL_BODY_TYPES = ('hash', 'json') # Decided only once the whole body has been read
+
+# === ASSERTIONS ===
+
+def compile_assertions(specs, expected_keyword=None):
+    """Validates assertion specs and prepares them for streaming. Raises ValueError on a bad spec.
+
+    `expected_keyword` (the legacy EXPECTED_KEYWORD setting) becomes a leading "contains" assertion.
+    """
+    specs = list(specs or [])
+    if expected_keyword: specs.insert(0, {'type': 'contains', 'value': expected_keyword})
+    compiled = []
+    for spec in specs:
+        if not isinstance(spec, dict) or spec.get('type') not in ASSERTION_TYPES:
+            raise ValueError(f"unknown assertion {spec!r}")
+        kind = spec['type']
+        assertion = {'type': kind, 'absent': bool(spec.get('absent')), 'spec': spec}
+        if kind == 'contains':
+            if not spec.get('value'): raise ValueError("contains assertion needs a non-empty 'value'")
+            assertion['needle'] = str(spec['value']).encode('utf-8')
+            assertion['overlap'] = len(assertion['needle']) - 1
+        elif kind == 'regex':
+            if not spec.get('pattern'): raise ValueError("regex assertion needs a 'pattern'")
+            try:
+                assertion['regex'] = re.compile(str(spec['pattern']).encode('utf-8'))
+            except re.error as e:
+                raise ValueError(f"regex assertion has an invalid 'pattern': {e}")
+            assertion['overlap'] = int(spec.get('window', DEFAULT_REGEX_WINDOW))
+        elif kind in ('min_bytes', 'max_bytes'):
+            if not isinstance(spec.get('value'), int): raise ValueError(f"{kind} assertion needs an integer 'value'")
+            assertion['limit'] = spec['value']
+        elif kind == 'hash':
+            if spec.get('expect') not in (None, 'changed', 'unchanged'): raise ValueError("hash assertion 'expect' must be 'changed' or 'unchanged'")
+        elif kind == 'json':
+            if not spec.get('path'): raise ValueError("json assertion needs a 'path'")
+            assertion['path'] = [int(part) if part.isdigit() else part for part in str(spec['path']).split('.')]
+        compiled.append(assertion)
+    return compiled
+
+def describe(assertion):
+    """Failure text for an assertion, e.g. "Keyword missing ('SimplePractice')"."""
+    spec = assertion['spec']
+    kind = assertion['type']
+    if kind == 'contains': return f"Unexpected text ('{spec['value']}')" if assertion['absent'] else f"Keyword missing ('{spec['value']}')"
+    if kind == 'regex': return f"Unexpected match /{spec['pattern']}/" if assertion['absent'] else f"No match for /{spec['pattern']}/"
+    if kind == 'min_bytes': return f"Body under {spec['value']} bytes"
+    if kind == 'max_bytes': return f"Body over {spec['value']} bytes"
+    if kind == 'json':
+        return f"JSON {spec['path']} != {spec['equals']!r}" if 'equals' in spec else f"JSON {spec['path']} missing"
+    return f"Content {'changed' if spec.get('expect') == 'unchanged' else 'unchanged'}"
+
+def hash_failure(assertions, previous_hash, content_hash):
+    """Failure text when a hash assertion's expectation ('changed'/'unchanged') is not met, else None."""
+    if previous_hash is None or content_hash is None: return None
+    changed = content_hash != previous_hash
+    for assertion in assertions:
+        expect = assertion['spec'].get('expect') if assertion['type'] == 'hash' else None
+        if expect and changed != (expect == 'changed'): return describe(assertion)
+    return None
+
+def watches_changes(assertions):
+    """True when a hash assertion without an expectation asks to be told about content changes."""
+    return any(a['type'] == 'hash' and not a['spec'].get('expect') for a in assertions)
+
+# === STREAMING VALIDATION ===
+
+def start(assertions, max_read_bytes=MAX_READ_BYTES, started=None):
+    """Begins validating one response. `started` (perf_counter) is when the request was sent."""
+    # With no assertions the body is still read to the end (capped), so load times stay whole-page
+    needs_full_body = not assertions or any(a['type'] in FULL_BODY_TYPES for a in assertions)
+    return {
+        'assertions': assertions, 'results': [None] * len(assertions), 'tails': [b''] * len(assertions),
+        'bytes_read': 0, 'max_read_bytes': max_read_bytes, 'started': started if started is not None else time.perf_counter(),
+        'first_pass': None, 'truncated': False, 'stopped': False,
+        'hash': hashlib.sha256() if any(a['type'] == 'hash' for a in assertions) else None,
+        'body': [] if any(a['type'] == 'json' for a in assertions) else None,
+        'needs_full_body': needs_full_body,
+    }
+
+def _decide(validation, index, passed):
+    validation['results'][index] = passed
+    if passed and validation['first_pass'] is None:
+        validation['first_pass'] = time.perf_counter() - validation['started']
+
+def _search(assertion, tail, chunk):
+    """Looks for the assertion's text in chunk, including matches that began in the carried-over tail."""
+    window = tail + chunk
+    if assertion['type'] == 'contains': found = assertion['needle'] in window
+    else: found = assertion['regex'].search(window) is not None
+    return found, (window[-assertion['overlap']:] if assertion['overlap'] > 0 else b'')
+
+def feed(validation, chunk):
+    """Evaluates one body chunk. Returns True once reading further cannot change the outcome."""
+    if validation['bytes_read'] + len(chunk) > validation['max_read_bytes']:
+        chunk = chunk[:max(0, validation['max_read_bytes'] - validation['bytes_read'])]
+        validation['truncated'] = True
+    validation['bytes_read'] += len(chunk)
+    if validation['hash'] is not None: validation['hash'].update(chunk)
+    if validation['body'] is not None: validation['body'].append(chunk)
+    for index, assertion in enumerate(validation['assertions']):
+        if validation['results'][index] is not None: continue
+        kind = assertion['type']
+        if kind in ('contains', 'regex'):
+            found, validation['tails'][index] = _search(assertion, validation['tails'][index], chunk)
+            if found: _decide(validation, index, not assertion['absent'])
+        elif kind == 'min_bytes' and validation['bytes_read'] >= assertion['limit']:
+            _decide(validation, index, True)
+        elif kind == 'max_bytes' and validation['bytes_read'] > assertion['limit']:
+            _decide(validation, index, False)
+    validation['stopped'] = validation['truncated'] or decided(validation) # The caller stops reading here
+    return validation['stopped']
+
+def decided(validation):
+    """True when a failure is known, or every assertion has passed and none needs the rest of the body."""
+    if False in validation['results']: return True
+    return not validation['needs_full_body'] and None not in validation['results']
+
+def _json_value(document, path):
+    for part in path:
+        if isinstance(document, list) and isinstance(part, int) and part < len(document): document = document[part]
+        elif isinstance(document, dict) and str(part) in document: document = document[str(part)]
+        else: raise KeyError(part)
+    return document
+
+def finish(validation):
+    """Settles undecided assertions against the body seen (to the end, or up to the byte cap).
+
+    Hash assertions pass here; comparing with the previous check's hash is hash_failure's job.
+    `content_hash` is None unless the body was read to the end (not capped or stopped early).
+
+    Returns {'passed', 'failure', 'first_pass', 'bytes_read', 'truncated', 'content_hash'}.
+    """
+    content_hash = validation['hash'].hexdigest() if validation['hash'] is not None and not validation['stopped'] else None
+    for index, assertion in enumerate(validation['assertions']):
+        if validation['results'][index] is not None: continue
+        kind = assertion['type']
+        if kind in ('contains', 'regex'): passed = assertion['absent'] # Never found
+        elif kind == 'min_bytes': passed = False
+        elif kind == 'max_bytes': passed = True
+        elif kind == 'hash': passed = True
+        else:
+            try:
+                value = _json_value(json.loads(b''.join(validation['body'])), assertion['path'])
+                passed = value == assertion['spec']['equals'] if 'equals' in assertion['spec'] else True
+            except (ValueError, KeyError, TypeError):
+                passed = False
+        _decide(validation, index, passed)
+    failures = [describe(a) for a, passed in zip(validation['assertions'], validation['results']) if not passed]
+    failure = failures[0] if failures else None
+    if failure and validation['truncated']: failure += f" (first {validation['bytes_read']} bytes)"
+    return {
+        'passed': not failures, 'failure': failure,
+        'first_pass': round(validation['first_pass'], 4) if validation['first_pass'] is not None else None,
+        'bytes_read': validation['bytes_read'], 'truncated': validation['truncated'], 'content_hash': content_hash,
+    }